@@ -0,0 +1,105 @@
+"""
+Compare ObservedPrimary parse time: BeautifulSoup + prettify vs the byte-level extractor.
+
+Runs both extraction paths over a corpus of saved gauge pages (every *.html file in
+--corpus) or, without a corpus, over synthetic pages of --size KB. Prints mean
+per-page times and the speedup, and optionally writes them to a JSON file.
+
+Usage:
+    python app/bench/bench_extract.py --corpus saved_pages/ --repeat 20
+    python app/bench/bench_extract.py --synthetic 10 --size 300 --json results.json
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import report_generator  # noqa: E402
+
+
+def synthetic_page(size_kb, offset=0.5):
+    """
+    Build a gauge-like page of roughly size_kb KB with the value at `offset` of the body.
+    """
+    filler = '<div class="row"><span>stage</span><span>flow</span></div>\n'
+    rows = max(1, (size_kb * 1024) // len(filler))
+    split = int(rows * offset) * len(filler)  # Insert between rows so the markup stays valid
+    body = filler * rows
+    value = round(random.uniform(-5, 40), 2)
+    script = f'<script>window.__DATA__={{"ObservedPrimary":{value},"Units":"ft"}}</script>'
+    return f'<html><head><title>Gauge</title></head><body>{body[:split]}{script}{body[split:]}</body></html>'.encode()
+
+
+def load_corpus(args):
+    """Return a list of (name, page bytes)."""
+    if args.corpus:
+        paths = sorted(glob.glob(os.path.join(args.corpus, '*.html')))
+        return [(os.path.basename(p), open(p, 'rb').read()) for p in paths]
+    return [(f'synthetic_{i}', synthetic_page(args.size, random.random())) for i in range(args.synthetic)]
+
+
+def time_legacy(page):
+    start = time.perf_counter()
+    value = report_generator.parse_observed_primary_html(page.decode('utf-8', errors='replace'))
+    return time.perf_counter() - start, value
+
+
+def time_bytes(page):
+    start = time.perf_counter()
+    chunks = (page[i:i + report_generator.CHUNK_SIZE] for i in range(0, len(page), report_generator.CHUNK_SIZE))
+    value, _ = report_generator.extract_observed_primary(chunks)
+    if value is None:
+        value = report_generator.parse_observed_primary_html(page.decode('utf-8', errors='replace'))
+    return time.perf_counter() - start, value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--corpus', help='Directory of saved gauge pages (*.html)')
+    parser.add_argument('--synthetic', type=int, default=10, help='Synthetic pages when no corpus is given')
+    parser.add_argument('--size', type=int, default=300, help='Synthetic page size in KB')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed passes over the corpus')
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    pages = load_corpus(args)
+    if not pages:
+        sys.exit('No pages to benchmark')
+
+    legacy_total = bytes_total = 0.0
+    mismatches = []
+    for _ in range(args.repeat):
+        for name, page in pages:
+            legacy_time, legacy_value = time_legacy(page)
+            bytes_time, bytes_value = time_bytes(page)
+            legacy_total += legacy_time
+            bytes_total += bytes_time
+            if legacy_value != bytes_value and name not in mismatches:
+                mismatches.append(name)
+
+    runs = args.repeat * len(pages)
+    results = {
+        'pages': len(pages),
+        'repeat': args.repeat,
+        'legacy_ms_per_page': legacy_total / runs * 1000,
+        'bytes_ms_per_page': bytes_total / runs * 1000,
+        'speedup': legacy_total / bytes_total if bytes_total else None,
+        'mismatches': mismatches,
+    }
+    print(f"{results['pages']} pages x {args.repeat}: "
+          f"BeautifulSoup {results['legacy_ms_per_page']:.3f} ms/page, "
+          f"bytes {results['bytes_ms_per_page']:.3f} ms/page, "
+          f"{results['speedup']:.1f}x faster")
+    if mismatches:
+        print(f"Value mismatches: {', '.join(mismatches)}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
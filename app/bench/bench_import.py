@@ -0,0 +1,127 @@
+"""
+Cold-start benchmark: how long `import report_generator` takes and what it drags in.
+
+Each run imports the module in a fresh interpreter with `-X importtime`, the way a
+cron/Task Scheduler launch does. Bytecode is cached under a scratch
+PYTHONPYCACHEPREFIX (after one warm-up run) so the numbers match an installed
+script rather than a first compile. Reports the import time of report_generator
+(median and min over the runs), process start-up with and without the import, the
+heaviest modules it imports, and any import side effects (files created in the
+working directory, threads started, heavy libraries loaded).
+
+Usage:
+    python app/bench/bench_import.py --runs 20
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('requests', 'urllib3', 'bs4', 'asyncio', 'numpy', 'sqlite3')
+PROBE = (
+    "import json, os, sys, threading; sys.path.insert(0, {app_dir!r}); import report_generator; "
+    "print(json.dumps({{'threads': threading.active_count(), 'files': sorted(os.listdir('.')), "
+    "'heavy': [m for m in {heavy!r} if m in sys.modules]}}))"
+)
+
+
+def parse_importtime(stderr):
+    """Return [(self_us, cumulative_us, depth, module)] from `-X importtime` output."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        entries.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return entries
+
+
+def subtree(entries, module):
+    """Return the entry for module and the entries it imported (importtime lists children first)."""
+    for index, entry in enumerate(entries):
+        if entry[3] == module:
+            children = []
+            for child in reversed(entries[:index]):
+                if child[2] <= entry[2]:
+                    break
+                children.append(child)
+            return entry, children
+    return None, []
+
+
+def run_once(env, workdir, code, importtime=True):
+    """Run code in a fresh interpreter and return (wall seconds, stdout, stderr)."""
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', code]
+    start = time.perf_counter()
+    result = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True, check=True)
+    return time.perf_counter() - start, result.stdout, result.stderr
+
+
+def main():
+    parser = argparse.ArgumentParser(description='report_generator import-time benchmark')
+    parser.add_argument('--runs', type=int, default=10, help='Fresh interpreters to time')
+    parser.add_argument('--top', type=int, default=10, help='Heaviest imported modules to list')
+    parser.add_argument('--output', default='bench_import.json', help='Results JSON file')
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix='noaa_import_')
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    env['PYTHONPYCACHEPREFIX'] = os.path.join(scratch, 'pycache')
+    code = PROBE.format(app_dir=APP_DIR, heavy=HEAVY_MODULES)
+
+    # Warm-up: writes the bytecode cache and shows what a first import leaves behind
+    first_dir = os.path.join(scratch, 'first')
+    os.makedirs(first_dir)
+    _, stdout, _ = run_once(env, first_dir, code)
+    side_effects = json.loads(stdout)
+
+    imports = []
+    walls = []
+    baseline = []
+    entries = []
+    for run in range(args.runs):
+        workdir = os.path.join(scratch, f'run{run}')
+        os.makedirs(workdir)
+        wall, _, stderr = run_once(env, workdir, code)
+        entries = parse_importtime(stderr)
+        entry, _ = subtree(entries, 'report_generator')
+        imports.append(entry[1] / 1000.0)
+        walls.append(run_once(env, workdir, code, importtime=False)[0] * 1000.0)
+        baseline.append(run_once(env, workdir, 'pass', importtime=False)[0] * 1000.0)
+
+    _, children = subtree(entries, 'report_generator')
+    heaviest = sorted(children, key=lambda child: child[0], reverse=True)[:args.top]
+    result = {
+        'runs': args.runs,
+        'import_ms': {'median': round(statistics.median(imports), 2), 'min': round(min(imports), 2)},
+        'process_ms': {'median': round(statistics.median(walls), 2), 'min': round(min(walls), 2)},
+        'interpreter_ms': {'median': round(statistics.median(baseline), 2), 'min': round(min(baseline), 2)},
+        'modules_imported': len(children),
+        'heaviest': [{'module': name, 'self_ms': round(self_us / 1000.0, 2)} for self_us, _, _, name in heaviest],
+        'side_effects': side_effects,
+    }
+
+    print(f"import report_generator: median {result['import_ms']['median']} ms, min {result['import_ms']['min']} ms "
+          f"({len(children)} modules)")
+    print(f"python -c 'import report_generator': median {result['process_ms']['median']} ms "
+          f"(bare interpreter {result['interpreter_ms']['median']} ms)")
+    for item in result['heaviest']:
+        print(f"  {item['self_ms']:8.2f} ms  {item['module']}")
+    print(f"side effects: {side_effects['threads']} thread(s), files created {side_effects['files'] or 'none'}, "
+          f"heavy modules loaded {side_effects['heavy'] or 'none'}")
+
+    output = os.path.abspath(args.output)
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f'Results written to {output}')
+
+
+if __name__ == '__main__':
+    main()
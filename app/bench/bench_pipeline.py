@@ -0,0 +1,227 @@
+"""
+End-to-end benchmark of the report pipeline against the local mock NOAA server.
+
+Runs generate_reports -> make_csv for the three shipped rivers and for synthetic
+catalogs of the requested sizes, with each fetch engine, inside a scratch working
+directory. The mock server's latency, jitter, stalls, error rate and page size are
+configurable. Results (wall time, requests/sec, p50/p95/p99 per-gauge latency and
+peak RSS) are printed and written to a JSON file. With --hedge every run is
+repeated with hedged requests on, and the p99 change is reported. Each engine
+gets one untimed warm-up pass first, and every timed run starts with a fresh
+HTTP session, so results do not depend on the order the engines run in.
+
+Usage:
+    python app/bench/bench_pipeline.py --latency 0.05 --jitter 0.05 --synthetic 100,1000
+    python app/bench/bench_pipeline.py --stall-rate 0.03 --stall 2 --synthetic 1000 --hedge
+"""
+import argparse
+import csv
+import glob
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+import mock_noaa  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of values (0 when empty)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def peak_rss_kb():
+    """Peak resident set size of this process in KB, or None where unsupported."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def copy_shipped_catalogs(src_dir, base):
+    """Copy the shipped *_src.csv files with gauge URLs pointed at the mock server."""
+    rivers = []
+    for path in sorted(glob.glob(os.path.join(APP_DIR, 'src', '*_src.csv'))):
+        name = os.path.basename(path)
+        with open(path, newline='') as f:
+            text = f.read().replace('https://water.noaa.gov', base)
+        with open(os.path.join(src_dir, name), 'w', newline='') as f:
+            f.write(text)
+        rivers.append(name[:-len('_src.csv')])
+    return rivers
+
+
+def write_synthetic_catalogs(src_dir, base, gauges, rivers=3, duplicate_every=10):
+    """
+    Write `rivers` synthetic catalogs with `gauges` rows in total.
+
+    Every `duplicate_every`-th row repeats the previous gauge, like the shared
+    gauges in the shipped catalogs.
+    """
+    names = [f'syn{i + 1}' for i in range(rivers)]
+    headers = ['Zone', 'Gauge', 'URL', 'Mile Markers', 'Low Action', 'Low Watch',
+               'Normal', 'High Watch', 'High Action', 'Current']
+    lid = 0
+    for r, name in enumerate(names):
+        count = gauges // rivers + (1 if r < gauges % rivers else 0)
+        with open(os.path.join(src_dir, f'{name}_src.csv'), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(headers)
+            for i in range(count):
+                if not (i and i % duplicate_every == 0):
+                    lid += 1
+                gauge = f'syn{lid:05d}'
+                writer.writerow([i + 1, f'Synthetic ({gauge.upper()})', f'{base}/gauges/{gauge}',
+                                 f'[{i}.0, {i}.9]', 1.0, '[1, 2]', '[2, 14]', '[14, 23]', 23.0, 0])
+    return names
+
+
+def count_rows(path):
+    """Number of data rows in a source CSV."""
+    with open(path, newline='') as f:
+        return sum(1 for _ in csv.DictReader(f))
+
+
+def run_scenario(report_generator, server, name, src_dir, rivers, engine, latencies, hedge=False):
+    """Run the pipeline once and return its result record."""
+    report_generator.close_sessions()  # Every run opens its own connections
+    latencies.clear()
+    requests_before = server.requests_served
+    report_generator.FETCH_ENGINE = engine
+    report_generator.hedger.enabled = hedge
+    report_generator.hedger.reset_stats()
+    start = time.perf_counter()
+    if engine == 'threaded':
+        report_generator.run_threaded(src_dir, rivers, report_generator.Deadline(report_generator.RUN_DEADLINE))
+    else:
+        report_generator.generate_all_reports(src_dir, rivers)
+    wall = time.perf_counter() - start
+    requests_made = server.requests_served - requests_before
+    result = {
+        'scenario': name,
+        'engine': engine,
+        'hedge': hedge,
+        'rows': sum(count_rows(os.path.join(src_dir, f'{river}_src.csv')) for river in rivers),
+        'requests': requests_made,
+        'wall_s': round(wall, 4),
+        'requests_per_s': round(requests_made / wall, 2) if wall else None,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50) * 1000, 2),
+            'p95': round(percentile(latencies, 95) * 1000, 2),
+            'p99': round(percentile(latencies, 99) * 1000, 2),
+        },
+        'peak_rss_kb': peak_rss_kb(),
+    }
+    if hedge:
+        result['hedged'] = report_generator.hedger.stats()['hedged']
+    label = f"{engine}+hedge" if hedge else engine
+    print(f"{name:>14} {label:>14}: {result['rows']:>6} rows, {requests_made:>6} requests, "
+          f"{wall:8.3f}s, {result['requests_per_s']:>8} req/s, "
+          f"p50/p95/p99 {result['latency_ms']['p50']}/{result['latency_ms']['p95']}/"
+          f"{result['latency_ms']['p99']} ms, peak RSS {result['peak_rss_kb']} KB")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end report pipeline benchmark')
+    parser.add_argument('--latency', type=float, default=0.02, help='Mock server latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.02, help='Extra random latency of up to this many seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 503')
+    parser.add_argument('--page-size', type=int, default=mock_noaa.PAGE_SIZE, help='Gauge page size in bytes')
+    parser.add_argument('--stall-rate', type=float, default=0.0, help='Fraction of requests the mock server stalls')
+    parser.add_argument('--stall', type=float, default=2.0, help='Seconds a stalled request waits')
+    parser.add_argument('--hedge', action='store_true', help='Repeat every run with hedged requests and compare p99')
+    parser.add_argument('--synthetic', default='100', help='Comma-separated synthetic catalog sizes (gauge rows)')
+    parser.add_argument('--engines', default='async,pool,threaded', help='Comma-separated fetch engines to run')
+    parser.add_argument('--output', default='bench_results.json', help='Results JSON file')
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    workdir = tempfile.mkdtemp(prefix='noaa_bench_')
+    os.chdir(workdir)  # report_generator writes logs/ and reports/ relative to the working directory
+    os.environ.setdefault('HTTP_CACHE', '0')  # Every run should hit the server
+    os.environ.setdefault('RATE_LIMIT_RPS', '0')  # Pacing a local server would only measure the limiter
+    import report_generator
+    report_generator.init_logging()
+    report_generator.logger.setLevel(logging.WARNING)
+
+    latencies = []
+    get_water_level = report_generator.get_water_level
+
+    def timed_get_water_level(*a, **kw):
+        start = time.perf_counter()
+        try:
+            return get_water_level(*a, **kw)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    report_generator.get_water_level = timed_get_water_level
+
+    server = mock_noaa.start_server(latency=args.latency, jitter=args.jitter,
+                                    error_rate=args.error_rate, page_size=args.page_size,
+                                    stall_rate=args.stall_rate, stall=args.stall)
+    base = mock_noaa.base_url(server)
+    engines = [e for e in args.engines.split(',') if e]
+    scenarios = []
+    shipped_dir = os.path.join(workdir, 'shipped') + os.sep
+    os.makedirs(shipped_dir)
+    scenarios.append(('shipped', shipped_dir, copy_shipped_catalogs(shipped_dir, base)))
+    for size in (int(n) for n in args.synthetic.split(',') if n):
+        src_dir = os.path.join(workdir, f'synthetic_{size}') + os.sep
+        os.makedirs(src_dir)
+        scenarios.append((f'synthetic_{size}', src_dir, write_synthetic_catalogs(src_dir, base, size)))
+
+    results = []
+    try:
+        # Untimed warm-up: imports, worker pools and the compiled catalog are shared by every run
+        _, warmup_dir, warmup_rivers = scenarios[0]
+        for engine in engines:
+            report_generator.FETCH_ENGINE = engine
+            if engine == 'threaded':
+                report_generator.run_threaded(warmup_dir, warmup_rivers,
+                                              report_generator.Deadline(report_generator.RUN_DEADLINE))
+            else:
+                report_generator.generate_all_reports(warmup_dir, warmup_rivers)
+
+        for name, src_dir, rivers in scenarios:
+            for engine in engines:
+                plain = run_scenario(report_generator, server, name, src_dir, rivers, engine, latencies)
+                results.append(plain)
+                if args.hedge:
+                    hedged = run_scenario(report_generator, server, name, src_dir, rivers, engine, latencies,
+                                          hedge=True)
+                    results.append(hedged)
+                    before, after = plain['latency_ms']['p99'], hedged['latency_ms']['p99']
+                    change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+                    print(f"{name:>14} {engine:>14}: hedging p99 {before} -> {after} ms ({change}), "
+                          f"{hedged['hedged']} hedged of {hedged['rows']} rows")
+    finally:
+        server.shutdown()
+        report_generator.shutdown_worker_pool()
+        report_generator.close_sessions()
+        report_generator.shutdown_logging()
+
+    with open(output, 'w') as f:
+        json.dump({
+            'server': {'latency': args.latency, 'jitter': args.jitter, 'stall_rate': args.stall_rate,
+                       'stall': args.stall, 'error_rate': args.error_rate, 'page_size': args.page_size},
+            'results': results,
+        }, f, indent=2)
+    print(f'Results written to {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Compare the 'html' and 'nwps' gauge source adapters against the local mock server.
+
+Fetches every unique gauge in the shipped source CSVs through each adapter and
+reports wall time, mean per-gauge latency and bytes transferred. No network access
+is needed: both adapters are pointed at app/mock_noaa.py.
+
+Usage:
+    python app/bench/bench_sources.py --repeat 3 --json results.json
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+os.environ.setdefault('HTTP_CACHE', '0')  # Every fetch should hit the server
+os.environ.setdefault('RATE_LIMIT_RPS', '0')  # Pacing a local server would only measure the limiter
+import mock_noaa  # noqa: E402
+import report_generator  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare gauge source adapters on the mock server')
+    parser.add_argument('--src', default=os.path.join(APP_DIR, 'src') + os.sep, help='Source CSV directory')
+    parser.add_argument('--repeat', type=int, default=3, help='Passes over the gauge set per adapter')
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    report_generator.init_logging()
+    report_generator.logger.setLevel(logging.WARNING)
+    _, plan = report_generator.plan_fetches(args.src)
+    server = mock_noaa.start_server()
+    base = mock_noaa.base_url(server)
+    report_generator.NWPS_API_URL = f'{base}/nwps/v1'
+    urls = [f'{base}/gauges/{lid}' for lid in plan]
+
+    results = {'gauges': len(urls), 'repeat': args.repeat, 'sources': {}}
+    try:
+        for source in ('html', 'nwps'):
+            bytes_before = server.bytes_sent
+            latencies = []
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                for url in urls:
+                    fetch_start = time.perf_counter()
+                    report_generator.get_water_level(url, source=source)
+                    latencies.append(time.perf_counter() - fetch_start)
+            wall = time.perf_counter() - start
+            results['sources'][source] = {
+                'wall_s': wall,
+                'mean_ms': sum(latencies) / len(latencies) * 1000,
+                'bytes_per_gauge': (server.bytes_sent - bytes_before) / len(latencies),
+            }
+            stats = results['sources'][source]
+            print(f"{source:>5}: {wall:.3f}s total, {stats['mean_ms']:.2f} ms/gauge, "
+                  f"{stats['bytes_per_gauge']:.0f} bytes/gauge")
+    finally:
+        server.shutdown()
+        report_generator.close_sessions()
+        report_generator.shutdown_logging()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+Local stand-in for the NOAA gauge endpoints used by report_generator.
+
+Serves deterministic observations so the source adapters can be exercised and
+benchmarked without network access:
+
+- /gauges/<lid>                              HTML gauge page with an embedded "ObservedPrimary"
+- /nwps/v1/gauges/<lid>/stageflow/observed   NWPS stageflow JSON
+
+Response latency, jitter, stalls, error rate and page size are configurable for benchmarking.
+Run standalone with `python app/mock_noaa.py --port 8080`, then point the report at it
+with NWPS_API_URL=http://127.0.0.1:8080/nwps/v1 (and GAUGE_SOURCE=nwps).
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def stage_for(lid):
+    """Return a stable stage value in feet for a gauge ID."""
+    return round((zlib.crc32(lid.encode()) % 3000) / 100.0, 2)
+
+
+PAGE_SIZE = 96 * 1024  # Approximate size of a real gauge page in bytes
+
+
+def gauge_page(lid, size=PAGE_SIZE):
+    """
+    Render a gauge page shaped like water.noaa.gov, with the observation in an inline script.
+
+    The page is padded with markup to roughly `size` bytes; the script sits halfway through.
+    """
+    observed = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    data = json.dumps({'lid': lid.upper(), 'ObservedPrimary': stage_for(lid), 'ObservedPrimaryUnits': 'ft',
+                       'ObservedTime': observed.strftime('%Y-%m-%dT%H:%M:%SZ')}, separators=(',', ':'))
+    row = '<div class="row"><span>stage</span><span>flow</span></div>'
+    padding = row * max(0, size // len(row) // 2)
+    return (f'<!DOCTYPE html><html><head><title>{lid.upper()}</title></head><body>{padding}'
+            f'<div id="gauge">{lid.upper()}</div><script>window.__GAUGE__={data}</script>'
+            f'{padding}</body></html>').encode()
+
+
+def stageflow_observed(lid, points=8):
+    """Render an NWPS stageflow/observed document with `points` hourly observations, oldest first."""
+    now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    stage = stage_for(lid)
+    data = [{
+        'validTime': (now - timedelta(hours=points - 1 - i)).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'generatedTime': now.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'primary': round(stage - 0.01 * (points - 1 - i), 2),
+        'secondary': -999,
+    } for i in range(points)]
+    return json.dumps({
+        'pedts': 'HGIRG',
+        'primaryName': 'Stage',
+        'primaryUnits': 'ft',
+        'secondaryName': 'Flow',
+        'secondaryUnits': 'kcfs',
+        'data': data,
+    }, separators=(',', ':')).encode()
+
+
+class MockNoaaHandler(BaseHTTPRequestHandler):
+    """Request handler for the mock gauge page and NWPS endpoints."""
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real servers
+    disable_nagle_algorithm = True  # Avoid delayed-ACK stalls between headers and body
+
+    def do_GET(self):
+        server = self.server
+        delay = server.latency + random.uniform(0, server.jitter)
+        if server.stall_rate and random.random() < server.stall_rate:
+            delay += server.stall  # A stalled edge server, the tail that hedged requests cut off
+        if delay > 0:
+            time.sleep(delay)
+        if server.error_rate and random.random() < server.error_rate:
+            self._send(503, b'{"code":14,"message":"Service Unavailable"}', 'application/json')
+            return
+        parts = [p for p in self.path.split('?', 1)[0].split('/') if p]
+        if len(parts) == 2 and parts[0] == 'gauges':
+            self._send(200, gauge_page(parts[1].lower(), server.page_size), 'text/html; charset=utf-8')
+        elif parts[:3] == ['nwps', 'v1', 'gauges'] and parts[4:] == ['stageflow', 'observed'] and len(parts) == 6:
+            self._send(200, stageflow_observed(parts[3].lower()), 'application/json')
+        else:
+            self._send(404, b'{"code":5,"message":"Not Found"}', 'application/json')
+
+    def _send(self, status, body, content_type):
+        etag = f'"{zlib.crc32(body):08x}"'
+        if status == 200 and self.headers.get('If-None-Match') == etag:
+            status, body = 304, b''
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if status in (200, 304):
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server.stats_lock:
+            self.server.requests_served += 1
+            self.server.bytes_sent += len(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output quiet
+
+
+class MockNoaaServer(ThreadingHTTPServer):
+    """Threaded server that ignores clients hanging up mid-response (cancelled or hedged fetches)."""
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def _make_server(host, port, latency=0.0, jitter=0.0, error_rate=0.0, page_size=PAGE_SIZE,
+                 stall_rate=0.0, stall=0.0):
+    server = MockNoaaServer((host, port), MockNoaaHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.jitter = jitter
+    server.stall_rate = stall_rate
+    server.stall = stall
+    server.error_rate = error_rate
+    server.page_size = page_size
+    server.stats_lock = threading.Lock()
+    server.requests_served = 0
+    server.bytes_sent = 0
+    return server
+
+
+def start_server(host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0, page_size=PAGE_SIZE,
+                 stall_rate=0.0, stall=0.0):
+    """
+    Start the mock server on a background thread.
+
+    Args:
+        host (str): Interface to bind.
+        port (int): Port to bind; 0 picks a free port.
+        latency (float): Seconds to wait before answering each request.
+        jitter (float): Extra random delay of up to this many seconds per request.
+        error_rate (float): Fraction of requests answered with 503.
+        page_size (int): Approximate gauge page size in bytes.
+        stall_rate (float): Fraction of requests that stall before answering.
+        stall (float): Extra seconds a stalled request waits.
+
+    Returns:
+        ThreadingHTTPServer: The running server; call shutdown() to stop it.
+    """
+    server = _make_server(host, port, latency, jitter, error_rate, page_size, stall_rate, stall)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def base_url(server):
+    """Return the http://host:port root URL of a running mock server."""
+    host, port = server.server_address[:2]
+    return f'http://{host}:{port}'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local stand-in for the NOAA gauge endpoints')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds to wait before each response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Extra random delay of up to this many seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 503')
+    parser.add_argument('--page-size', type=int, default=PAGE_SIZE, help='Approximate gauge page size in bytes')
+    parser.add_argument('--stall-rate', type=float, default=0.0, help='Fraction of requests that stall')
+    parser.add_argument('--stall', type=float, default=0.0, help='Extra seconds a stalled request waits')
+    args = parser.parse_args()
+    server = _make_server(args.host, args.port, args.latency, args.jitter, args.error_rate, args.page_size,
+                          args.stall_rate, args.stall)
+    print(f'Mock NOAA server on {base_url(server)} (Ctrl+C to stop)')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
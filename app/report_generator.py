@@ -1,253 +1,3509 @@
-import logging
-import os
-import shutil
-from datetime import datetime
-import logging.handlers
-import queue
-import threading
-import requests
-from bs4 import BeautifulSoup
-import csv
-import re
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-
-
-# Configure thread-safe logging
-os.makedirs('logs', exist_ok=True)
-logger = logging.getLogger('noaa_river_report')  # Unique logger name
-logger.setLevel(logging.INFO)
-log_queue = queue.Queue()  # Queue for thread-safe logging
-queue_handler = logging.handlers.QueueHandler(log_queue)
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-queue_handler.setFormatter(formatter)
-logger.addHandler(queue_handler)
-
-# File handler
-file_handler = logging.FileHandler(f'logs/report_log_{datetime.now().strftime("%Y-%m-%d_%Hh%Mm%Ss")}.txt')
-file_handler.setLevel(logging.INFO)
-file_handler.setFormatter(formatter)
-
-# Console handler
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-console_handler.setFormatter(formatter)
-
-# Start QueueListener for thread-safe logging
-listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler)
-listener.start()
-
-# File write lock for thread safety
-report_lock = threading.Lock()
-
-
-def get_water_level(url, max_retries=3):
-    """
-    Fetch water level from the given URL with retry logic.
-
-    Args:
-        url (str): URL to fetch data from.
-        max_retries (int): Number of retry attempts.
-
-    Returns:
-        float: Water level if found, else None.
-    """
-    session = requests.Session()
-    retry = Retry(total=max_retries, backoff_factor=0.1, status_forcelist=[500, 502, 503, 504])
-    session.mount('http://', HTTPAdapter(max_retries=retry))
-    session.mount('https://', HTTPAdapter(max_retries=retry))
-
-    try:
-        response = session.get(url, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        # Robust regex to handle negative numbers and varying decimals
-        value = re.search(r'"ObservedPrimary":-?\d+\.\d*', soup.prettify())
-        # value = re.search(r'"ObservedPrimary":-?\d+\.\d{1,}', soup.prettify())
-        if value:
-            return float(value.group().split(':')[1])
-        else:
-            logger.warning(f"No 'ObservedPrimary' value found at {url}")
-            return None
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Failed to fetch data from {url}: {e}")
-        return None
-    except Exception as e:
-        logger.error(f"Unexpected error while processing {url}: {e}")
-        return None
-
-
-def generate_reports(path, river_name):
-    """
-    Generate a water level report for a specified river and save it as a CSV file.
-
-    Reads a CSV file containing gauge URLs for the given river, fetches current water
-    levels using get_water_level, and writes the results to a timestamped CSV file in
-    the reports/ directory. Caches water levels to avoid redundant requests for duplicate
-    URLs within the same river. Logs the process and any errors encountered.
-
-    Args:
-        path (str): Directory path to the input CSV files (e.g., 'program/app/src/').
-        river_name (str): Name of the river (e.g., 'ilr', 'umr', 'mor').
-
-    Returns:
-        None: The function writes output to a CSV file and logs results.
-    """
-    if not path or not river_name:
-        logger.error("Path or river_name cannot be empty")
-        return
-
-    file = path + river_name + '_src.csv'
-    if not os.path.exists(file):
-        logger.error(f"Input CSV file {file} not found")
-        return
-
-    report = []
-    url_cache = {}  # Cache water levels by URL within this river
-    empty_url_count = 0  # Track empty URLs
-    try:
-        with open(file, newline='') as csv_file:
-            reader = csv.DictReader(csv_file)
-            if not reader.fieldnames or not {'URL', 'Gauge'}.issubset(reader.fieldnames):
-                logger.error(f"Invalid or missing headers in {file}")
-                return
-            
-            for row in reader:
-                if row['URL']:
-                    # Check cache for URL
-                    if row['URL'] in url_cache:
-                        # logger.info(f"Using cached water level for {row['URL']}")
-                        current_level = url_cache[row['URL']]
-                    else:
-                        current_level = get_water_level(row['URL'])
-                        url_cache[row['URL']] = current_level
-                    row['Current'] = current_level if current_level is not None else "No Data"
-                    if current_level is None:
-                        logger.warning(f"Could not retrieve data for {row['Gauge']} {row['URL']}")
-                else:
-                    logger.warning(f"No URL provided for {row['Gauge']}")
-                    row['Current'] = "No Data"
-                    empty_url_count += 1
-                report.append(row)
-            
-            if not report:
-                logger.error(f"No data processed for {river_name} report")
-                return
-            
-            # Log cache and empty URL statistics
-            cache_hits = sum(1 for row in report if row['URL'] in url_cache and row['URL'])
-            logger.info(f"{river_name.upper()}: {cache_hits} URL hits")
-            if empty_url_count > 0:
-                logger.warning(f"Found {empty_url_count} rows with empty URLs in {river_name} report")
-            
-            # Write report to CSV; rely on make_csv for logging
-            make_csv(report, river_name, reader)
-    except csv.Error as e:
-        logger.error(f"Error processing CSV file: {e}")
-
-
-def make_csv(report_file, river_name, reader):
-    """
-    Write the report data to a timestamped CSV file and archive older CSVs.
-
-    Writes the report to a new CSV in 'reports/csv/'. Moves all older CSVs for the same
-    river to 'reports/csv/archive/', keeping only the newest CSV in 'reports/csv/'.
-
-    Args:
-        report_file (list): List of dictionaries containing report data.
-        river_name (str): Name of the river (e.g., 'ilr', 'umr', 'mor').
-        reader (csv.DictReader): CSV reader object with fieldnames.
-
-    Returns:
-        None: The function writes the CSV file, moves older CSVs, and logs results.
-    """
-    logger.info(f"Starting CSV writing process for {river_name.upper()}")
-    try:
-        # os.makedirs('reports/csv', exist_ok=True)
-        os.makedirs('reports/csv/archive', exist_ok=True)
-        output_filename = f'reports/csv/{river_name}_{datetime.now().strftime("%Y-%m-%d_%Hh%Mm%Ss")}.csv'
-        
-        # Write new CSV
-        with report_lock:  # Ensure thread-safe file writing
-            with open(output_filename, 'w', newline='') as csvfile:
-                headers = reader.fieldnames + ['Current']
-                writer = csv.DictWriter(csvfile, fieldnames=headers)
-                writer.writeheader()
-                writer.writerows(report_file)
-            logger.info(f"Success - {river_name.upper()} CSV written to {output_filename}")
-            
-            # Find and move older CSVs for this river
-            csv_dir = 'reports/csv/'
-            archive_dir = 'reports/csv/archive/'
-            pattern = f'{river_name}_*.csv'  # Match CSVs like 'mor_2025-05-02_12h00m00s.csv'
-            csv_files = [f for f in os.listdir(csv_dir) if f.startswith(f'{river_name}_') and f.endswith('.csv')]
-            
-            if csv_files:
-                # Sort files by creation time (newest first)
-                csv_files = sorted(
-                    [(f, os.path.getctime(os.path.join(csv_dir, f))) for f in csv_files],
-                    key=lambda x: x[1],
-                    reverse=True
-                )
-                newest_file = csv_files[0][0]  # Keep the newest file
-                logger.debug(f"Newest CSV for {river_name.upper()}: {newest_file}")
-                
-                # Move older files to archive
-                for file, _ in csv_files[1:]:  # Skip the newest
-                    src_path = os.path.join(csv_dir, file)
-                    dest_path = os.path.join(archive_dir, file)
-                    try:
-                        os.rename(src_path, dest_path)
-                        logger.info(f"Archived {river_name.upper()} CSV: {file} to {dest_path}")
-                    except OSError as e:
-                        logger.error(f"Failed to archive {file} to {dest_path}: {e}")
-            
-    except Exception as e:
-        logger.error(f"Failed to write CSV for {river_name.upper()}: {e}")
-
-
-def main():
-    """
-    Main function to process water level data for multiple rivers concurrently.
-
-    Creates threads to generate reports for each river ('ilr', 'umr', 'mor'), starts them,
-    and waits for completion. Logs the process and ensures proper cleanup.
-
-    Returns:
-        None
-    """
-    print('Now running the NOAA River Report Application')
-    
-    # Define source directory and list of rivers to process
-    src_location = 'program/app/src/'  # Path to input CSV files
-    rivers = ['ilr', 'umr', 'mor']    # River codes for processing
-
-    # Configurable thread timeout
-    timeout = int(os.getenv("THREAD_TIMEOUT", 60))
-
-    # Create and start threads for each river
-    threads = []  # Initialize empty list for thread objects
-    thread_rivers = []  # Track river names for debugging
-    for river in rivers:
-        logger.info(f"-------Obtaining {river.upper()} river data-------")
-        try:
-            thread = threading.Thread(target=generate_reports, args=(src_location, river))
-            threads.append(thread)
-            thread_rivers.append(river)  # Associate thread with river
-            thread.start()  # Start thread execution
-        except Exception as e:
-            logger.error(f"Failed to create/start thread for {river.upper()}: {e}")
-
-    # Wait for all threads to complete with timeout
-    for thread, river in zip(threads, thread_rivers):
-        thread.join(timeout=timeout)  # Wait up to configured timeout
-        if thread.is_alive():
-            logger.error(f"Thread for river {river.upper()} timed out")
-    
-    listener.stop()  # Stop logging listener and ensure buffers are flushed
-    log_queue.join()  # Wait for queue to empty
-    logging.shutdown()
-
-
-if __name__ == "__main__":
-    main()
+import logging
+import os
+import sys
+import hashlib
+import pickle
+import base64
+import gzip
+import json
+import random
+import time
+import tracemalloc
+import bisect
+import importlib
+import atexit
+from contextlib import contextmanager
+from collections import Counter, namedtuple, deque
+from urllib.parse import urlsplit
+from datetime import datetime, timezone
+import logging.handlers
+import queue
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import csv
+import re
+
+
+class _LazyModule:
+    """Stand-in for a module that is imported on first attribute access."""
+
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(importlib.import_module(self._name), attr)
+
+
+# HTTP, HTML parsing and asyncio are loaded on first use so importing this module stays cheap;
+# BeautifulSoup and HTTPAdapter are imported inside the functions that use them
+requests = _LazyModule('requests')
+asyncio = _LazyModule('asyncio')
+sqlite3 = _LazyModule('sqlite3')
+numpy = _LazyModule('numpy')
+
+logger = logging.getLogger('noaa_river_report')  # Unique logger name
+logger.setLevel(logging.INFO)
+log_queue = None  # Queue for thread-safe logging, created by init_logging
+listener = None  # QueueListener writing queued records to the log file and console
+log_file = None  # Path of this run's log file
+_logging_lock = threading.Lock()
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "midnight")  # Daemon log rotation interval (TimedRotatingFileHandler 'when')
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", 14))  # Rotated daemon log files kept
+
+
+def init_logging(log_dir='logs', rotate=None):
+    """
+    Set up thread-safe logging to a timestamped file in log_dir and to the console.
+
+    Records are queued by a QueueHandler on the logger and written by a
+    QueueListener thread, so river and worker threads never block on I/O. Safe
+    to call more than once; later calls return the running listener. A long-running
+    daemon rotates its log file every LOG_ROTATE_WHEN and keeps LOG_BACKUPS old files.
+
+    Args:
+        log_dir (str): Directory for the log file (created if missing).
+        rotate (bool): Rotate the log file (default REPORT_DAEMON).
+
+    Returns:
+        logging.handlers.QueueListener: The running listener.
+    """
+    global log_queue, listener, log_file
+    with _logging_lock:
+        if listener is not None:
+            return listener
+        os.makedirs(log_dir, exist_ok=True)
+        log_file = os.path.join(log_dir, f'report_log_{datetime.now().strftime("%Y-%m-%d_%Hh%Mm%Ss")}.txt')
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+
+        # File handler
+        if REPORT_DAEMON if rotate is None else rotate:
+            file_handler = logging.handlers.TimedRotatingFileHandler(
+                log_file, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUPS)
+        else:
+            file_handler = logging.FileHandler(log_file)
+        file_handler.setLevel(logging.INFO)
+        file_handler.setFormatter(formatter)
+
+        # Console handler
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(logging.INFO)
+        console_handler.setFormatter(formatter)
+
+        # Formatting happens once, in the listener's handlers; the queue carries the bare message
+        log_queue = queue.Queue()
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler)
+        listener.start()
+        return listener
+
+
+def shutdown_logging():
+    """Stop the logging listener started by init_logging, flushing queued records to the handlers."""
+    global log_queue, listener
+    with _logging_lock:
+        if listener is None:
+            return
+        listener.stop()  # Stop logging listener and ensure buffers are flushed
+        for handler in list(logger.handlers):
+            if isinstance(handler, logging.handlers.QueueHandler):
+                logger.removeHandler(handler)
+        for handler in listener.handlers:
+            handler.close()
+        listener = None
+        log_queue = None
+
+# File write lock for thread safety
+report_lock = threading.Lock()
+
+# Fetch engine: 'async' issues every gauge request at once, 'pool' queues per-gauge tasks on a
+# shared worker pool, 'threaded' keeps one thread per river
+FETCH_ENGINE = os.getenv("FETCH_ENGINE", "async")
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", 16))  # Global cap on in-flight requests
+FETCH_TIMEOUT = float(os.getenv("FETCH_TIMEOUT", 30))  # Per-request wall-clock timeout in seconds
+RUN_DEADLINE = float(os.getenv("RUN_DEADLINE", os.getenv("THREAD_TIMEOUT", 60)))  # Seconds per report cycle
+CANCEL_GRACE = 5  # Seconds cancelled river threads get to write their partial reports
+REQUEST_TIMEOUT = 10  # Socket timeout for a single HTTP request in seconds
+TIMED_OUT = "Timed Out"  # Report value for gauges that did not answer before the run deadline
+
+
+class FetchCancelled(Exception):
+    """Raised inside a fetch when the run deadline has expired or been cancelled."""
+
+
+class Deadline:
+    """
+    Run-wide time budget shared by every fetch in a report cycle.
+
+    Fetches size their timeouts from remaining() and stop between reads once
+    expired() is true; cancel() ends the budget early for everything still running.
+    A deadline with a parent also expires with the parent, so a single fetch can be
+    cancelled on its own without touching the rest of the run.
+    """
+
+    def __init__(self, seconds, parent=None):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+        self.cancelled = threading.Event()
+        self.parent = parent
+
+    def remaining(self):
+        """Seconds left in the budget (0 once expired or cancelled)."""
+        if self.cancelled.is_set():
+            return 0.0
+        remaining = max(0.0, self.expires_at - time.monotonic())
+        if self.parent is not None:
+            remaining = min(remaining, self.parent.remaining())
+        return remaining
+
+    def expired(self):
+        """Return True once the budget has run out or been cancelled."""
+        return self.remaining() <= 0
+
+    def cancel(self):
+        """Stop every fetch that is still using this budget."""
+        self.cancelled.set()
+
+    def timeout(self, default):
+        """Clamp a per-request timeout to the remaining budget."""
+        return max(0.1, min(default, self.remaining()))
+
+
+# Run metrics, exported at the end of every report cycle
+RUN_METRICS = os.getenv("RUN_METRICS", "1") == "1"  # Set to 0 to skip writing the metrics files
+METRICS_DIR = os.getenv("METRICS_DIR", "logs")  # Directory for the per-run JSON summaries
+METRICS_TEXTFILE = os.getenv("METRICS_TEXTFILE", "logs/noaa_river_report.prom")  # Prometheus textfile, overwritten per run
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)  # Upper bounds of the gauge fetch histogram in seconds
+FETCH_PHASES = ('wait', 'ttfb', 'download', 'parse')
+
+
+def _new_timings():
+    """Return an empty per-fetch timing record for _fetch_state.timings."""
+    return {'wait': 0.0, 'ttfb': 0.0, 'download': 0.0, 'bytes': 0}
+
+
+def _add_timing(key, amount):
+    """Add to the current thread's fetch timing record, if a fetch is being measured."""
+    timings = getattr(_fetch_state, 'timings', None)
+    if timings is not None:
+        timings[key] += amount
+
+
+class RunMetrics:
+    """
+    Instrumentation for one report cycle.
+
+    Stage timings (load, fetch, classify, write, archive) are summed across rivers,
+    so with the threaded engine they can add up to more than the run's wall time.
+    Every get_water_level call records its total time split into phases: wait
+    (rate limiter and retry backoff), ttfb (request sent until response headers,
+    including DNS and connect, which requests does not expose separately),
+    download (reading the body) and parse (the rest), plus the body bytes read.
+    Fetch totals, outcomes and the latency histogram count every call, and each
+    gauge gets a summary of all of its calls, so a gauge fetched more than once
+    in a cycle (once per river with the threaded engine) is counted each time.
+    export() writes a JSON summary and a Prometheus textfile.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Start a new cycle, dropping everything recorded so far."""
+        with self.lock:
+            self.started = datetime.now()
+            self.started_at = time.perf_counter()
+            self.stages = {}
+            self.latencies = []  # Seconds of every fetch call
+            self.outcomes = Counter()
+            self.caches = Counter()
+            self.totals = dict.fromkeys(('bytes',) + FETCH_PHASES, 0)
+            self.gauges = {}  # Gauge ID -> summary of its fetches
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block and add it to stage `name` (and to the profiler's memory report)."""
+        started = time.perf_counter()
+        before = pipeline_profiler.snapshot()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - started)
+            if before is not None:
+                pipeline_profiler.record_stage(name, before)
+
+    def add_stage(self, name, seconds):
+        """Add `seconds` to stage `name`."""
+        with self.lock:
+            total = self.stages.setdefault(name, {'seconds': 0.0, 'count': 0})
+            total['seconds'] += seconds
+            total['count'] += 1
+
+    def record_fetch(self, gauge, seconds, outcome, cache, timings):
+        """Record one gauge fetch call and its phase split."""
+        timings = timings or _new_timings()
+        amounts = {
+            'bytes': timings['bytes'],
+            'wait': timings['wait'],
+            'ttfb': timings['ttfb'],
+            'download': timings['download'],
+        }
+        amounts['parse'] = max(0.0, seconds - amounts['wait'] - amounts['ttfb'] - amounts['download'])
+        with self.lock:
+            self.latencies.append(seconds)
+            self.outcomes[outcome] += 1
+            self.caches[cache or 'none'] += 1
+            record = self.gauges.setdefault(gauge, dict.fromkeys(('fetches', 'seconds') + tuple(amounts), 0))
+            record['fetches'] += 1
+            record['seconds'] += seconds
+            record['outcome'] = outcome  # Of the latest call
+            record['cache'] = cache
+            for name, amount in amounts.items():
+                self.totals[name] += amount
+                record[name] += amount
+
+    def summary(self, **sections):
+        """
+        Return the cycle's metrics as a JSON-ready dict.
+
+        Args:
+            **sections: Extra top-level sections to include (e.g. rate limiter stats).
+
+        Returns:
+            dict: Run, stage and fetch metrics over every fetch call, and a
+                per-gauge summary of each gauge's calls.
+        """
+        with self.lock:
+            gauges = {gauge: dict(record) for gauge, record in self.gauges.items()}
+            stages = {name: dict(total) for name, total in self.stages.items()}
+            latencies = sorted(self.latencies)
+            outcomes = dict(self.outcomes)
+            caches = dict(self.caches)
+            totals = dict(self.totals)
+            started = self.started
+            duration = time.perf_counter() - self.started_at
+        histogram = {str(bound): sum(1 for value in latencies if value <= bound) for bound in LATENCY_BUCKETS}
+        histogram['+Inf'] = len(latencies)
+
+        def percentile(pct):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(len(latencies) * pct / 100))]
+
+        summary = {
+            'started': started.isoformat(timespec='seconds'),
+            'duration_s': round(duration, 4),
+            'engine': FETCH_ENGINE,
+            'stages': stages,
+            'fetches': {
+                'count': len(latencies),
+                'outcomes': outcomes,
+                'cache': caches,
+                'bytes': totals['bytes'],
+                'seconds': sum(latencies),
+                'latency_s': {'p50': percentile(50), 'p90': percentile(90), 'p99': percentile(99),
+                              'max': latencies[-1] if latencies else 0.0},
+                'histogram': histogram,
+                'phases_s': {phase: totals[phase] for phase in FETCH_PHASES},
+            },
+            'gauges': gauges,
+        }
+        summary.update(sections)
+        return summary
+
+    def export(self, **sections):
+        """
+        Write the cycle summary to METRICS_DIR as JSON and to METRICS_TEXTFILE for Prometheus.
+
+        Args:
+            **sections: Extra top-level sections for the JSON summary.
+
+        Returns:
+            dict: The summary that was written.
+        """
+        summary = self.summary(**sections)
+        json_file = os.path.join(METRICS_DIR, f'run_metrics_{self.started.strftime("%Y-%m-%d_%Hh%Mm%Ss")}.json')
+        try:
+            _write_atomic(json_file, json.dumps(summary, indent=1).encode('utf-8'))
+            _write_atomic(METRICS_TEXTFILE, _prometheus_text(summary).encode('utf-8'))
+            logger.info(f"Run metrics written to {json_file} and {METRICS_TEXTFILE}")
+        except OSError as e:
+            logger.error(f"Failed to write run metrics: {e}")
+        return summary
+
+
+def _prometheus_text(summary):
+    """Render a RunMetrics summary in the Prometheus text exposition format."""
+    def label(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    fetches = summary['fetches']
+    lines = [
+        '# HELP noaa_report_run_duration_seconds Wall time of the last report cycle.',
+        '# TYPE noaa_report_run_duration_seconds gauge',
+        f'noaa_report_run_duration_seconds {summary["duration_s"]}',
+        '# HELP noaa_report_run_timestamp_seconds Start time of the last report cycle.',
+        '# TYPE noaa_report_run_timestamp_seconds gauge',
+        f'noaa_report_run_timestamp_seconds {datetime.fromisoformat(summary["started"]).timestamp():.0f}',
+        '# HELP noaa_report_stage_seconds Time spent in each pipeline stage, summed across rivers.',
+        '# TYPE noaa_report_stage_seconds gauge',
+    ]
+    lines += [f'noaa_report_stage_seconds{{stage="{label(name)}"}} {total["seconds"]:.6f}'
+              for name, total in sorted(summary['stages'].items())]
+    lines += [
+        '# HELP noaa_report_gauge_fetch_seconds Gauge fetch latency in the last report cycle.',
+        '# TYPE noaa_report_gauge_fetch_seconds histogram',
+    ]
+    lines += [f'noaa_report_gauge_fetch_seconds_bucket{{le="{bound}"}} {count}'
+              for bound, count in fetches['histogram'].items()]
+    lines += [
+        f'noaa_report_gauge_fetch_seconds_sum {fetches["seconds"]:.6f}',
+        f'noaa_report_gauge_fetch_seconds_count {fetches["count"]}',
+        '# HELP noaa_report_fetch_phase_seconds Gauge fetch time by phase, summed over gauges.',
+        '# TYPE noaa_report_fetch_phase_seconds gauge',
+    ]
+    lines += [f'noaa_report_fetch_phase_seconds{{phase="{phase}"}} {seconds:.6f}'
+              for phase, seconds in fetches['phases_s'].items()]
+    lines += [
+        '# HELP noaa_report_fetches Gauge fetches in the last report cycle by outcome.',
+        '# TYPE noaa_report_fetches gauge',
+    ]
+    lines += [f'noaa_report_fetches{{outcome="{label(outcome)}"}} {count}'
+              for outcome, count in sorted(fetches['outcomes'].items())]
+    lines += [
+        '# HELP noaa_report_bytes_received Response body bytes read in the last report cycle.',
+        '# TYPE noaa_report_bytes_received gauge',
+        f'noaa_report_bytes_received {fetches["bytes"]}',
+    ]
+    limiter = summary.get('rate_limiter')
+    if limiter is not None:
+        lines += [
+            '# HELP noaa_report_rate_limit_wait_seconds Time requests waited for the rate limiter.',
+            '# TYPE noaa_report_rate_limit_wait_seconds gauge',
+            f'noaa_report_rate_limit_wait_seconds {limiter["wait_time"]:.6f}',
+            '# HELP noaa_report_throttled_responses 429/503 answers in the last report cycle.',
+            '# TYPE noaa_report_throttled_responses gauge',
+            f'noaa_report_throttled_responses {limiter["throttled"]}',
+        ]
+    lines += [
+        '# HELP noaa_report_gauge_seconds Fetch time of each gauge in the last report cycle by phase, summed over its fetches.',
+        '# TYPE noaa_report_gauge_seconds gauge',
+    ]
+    for gauge, record in sorted(summary['gauges'].items()):
+        lines.append(f'noaa_report_gauge_seconds{{gauge="{label(gauge)}",phase="total"}} {record["seconds"]:.6f}')
+        lines += [f'noaa_report_gauge_seconds{{gauge="{label(gauge)}",phase="{phase}"}} {record[phase]:.6f}'
+                  for phase in FETCH_PHASES]
+    return '\n'.join(lines) + '\n'
+
+
+run_metrics = RunMetrics()
+
+# Opt-in profiling of the whole pipeline, configurable via environment variables
+REPORT_PROFILE = os.getenv("REPORT_PROFILE", "0") == "1"
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", 0.005))  # Seconds between stack samples
+PROFILE_TOP = 20  # Allocation sites listed per stage in the memory report
+
+
+class PipelineProfiler:
+    """
+    Profiles a whole run for REPORT_PROFILE=1.
+
+    Three views are collected:
+    - Deterministic: cProfile on the calling thread, plus a cProfile started in
+      every thread created while profiling (river threads, pool workers), merged
+      into one pstats file. From Python 3.12 cProfile is built on sys.monitoring,
+      which sees every thread and allows only one active profiler, so the single
+      process-wide profiler is used instead.
+    - Sampling: a background thread reads sys._current_frames every `interval`
+      seconds and counts stacks in collapsed format (one line per stack, thread
+      name first, e.g. river-ilr), ready for flamegraph.pl or speedscope.
+    - Memory: a tracemalloc snapshot around every RunMetrics stage, listing the
+      allocation sites that grew. tracemalloc is process-wide, so stages running
+      at the same time on different threads share their numbers.
+    """
+
+    def __init__(self, interval, top):
+        self.interval = interval
+        self.top = top
+        self.active = False
+        self.lock = threading.Lock()
+        self.profiler = None
+        self.profile_class = None
+        self.thread_profilers = []
+        self.samples = {}
+        self.stage_reports = []
+        self.stop_event = threading.Event()
+        self.sampler = None
+
+    def start(self):
+        """Start tracemalloc, the sampler and the deterministic profilers."""
+        import cProfile
+        self.profile_class = cProfile.Profile
+        tracemalloc.start()
+        self.stop_event.clear()
+        self.sampler = threading.Thread(target=self._sample, name='profile-sampler', daemon=True)
+        self.sampler.start()
+        if sys.version_info < (3, 12):
+            threading.setprofile(self._profile_thread)
+        self.profiler = self.profile_class()
+        self.active = True
+        self.profiler.enable()
+
+    def _profile_thread(self, frame, event, arg):
+        # Runs once as the first profile event of each new thread, then hands over to cProfile
+        sys.setprofile(None)
+        profiler = self.profile_class()
+        try:
+            profiler.enable()
+        except ValueError:
+            return  # Another profiler already covers this thread; never let profiling break a worker
+        with self.lock:
+            self.thread_profilers.append(profiler)
+
+    def _sample(self):
+        me = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, f'thread-{ident}'))
+                key = ';'.join(reversed(stack))
+                self.samples[key] = self.samples.get(key, 0) + 1
+
+    def snapshot(self):
+        """Return a tracemalloc snapshot while profiling, else None."""
+        if not self.active:
+            return None
+        return tracemalloc.take_snapshot()
+
+    def record_stage(self, name, before):
+        """Add the allocation growth since `before` to the memory report under stage `name`."""
+        if not self.active:
+            return
+        growth = tracemalloc.take_snapshot().compare_to(before, 'lineno')
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"== {name} ({threading.current_thread().name}): traced {current / 1024:.0f} KB, "
+                 f"peak {peak / 1024:.0f} KB"]
+        lines += [str(stat) for stat in growth[:self.top]]
+        with self.lock:
+            self.stage_reports.append('\n'.join(lines))
+
+    def stop(self, prefix):
+        """
+        Stop profiling and write <prefix>.pstats, <prefix>.collapsed.txt and <prefix>.tracemalloc.txt.
+
+        Args:
+            prefix (str): Output path without extension, normally the run's log file.
+        """
+        if not self.active:
+            return
+        import pstats
+        self.profiler.disable()
+        if sys.version_info < (3, 12):
+            threading.setprofile(None)
+        self.active = False
+        self.stop_event.set()
+        self.sampler.join()
+
+        stats = pstats.Stats(self.profiler)
+        with self.lock:
+            thread_profilers = list(self.thread_profilers)
+        for profiler in thread_profilers:
+            try:
+                stats.add(profiler)
+            except TypeError:
+                pass  # Thread made no profiled calls
+        stats.dump_stats(f'{prefix}.pstats')
+        with open(f'{prefix}.collapsed.txt', 'w', encoding='utf-8') as file:
+            for stack, count in sorted(self.samples.items()):
+                file.write(f'{stack} {count}\n')
+        with open(f'{prefix}.tracemalloc.txt', 'w', encoding='utf-8') as file:
+            file.write('\n\n'.join(self.stage_reports) + '\n')
+        tracemalloc.stop()
+        logger.info(f"Profile written to {prefix}.pstats, {prefix}.collapsed.txt and {prefix}.tracemalloc.txt "
+                    f"({len(thread_profilers) + 1} threads profiled, {sum(self.samples.values())} stack samples)")
+
+
+pipeline_profiler = PipelineProfiler(PROFILE_INTERVAL, PROFILE_TOP)
+
+
+# Shared HTTP connection pool, configurable via environment variables
+POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", 4))  # Number of per-host pools to keep
+POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", 16))  # Max open connections per host
+POOL_BLOCK = os.getenv("HTTP_POOL_BLOCK", "0") == "1"  # Block instead of opening extra connections
+_sessions = {}  # The long-lived shared session, created on first use
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Return the shared, thread-safe HTTP session.
+
+    The session is created on first use and reused by every river thread, so
+    connections to water.noaa.gov stay open across gauges instead of paying a
+    new TCP+TLS handshake per request. The adapter does not retry on its own;
+    open_url retries with jittered backoff so retries respect the run deadline.
+
+    Returns:
+        requests.Session: Session backed by a pooled HTTPAdapter.
+    """
+    session = _sessions.get('default')
+    if session is not None:
+        return session
+    from requests.adapters import HTTPAdapter
+    with _session_lock:
+        session = _sessions.get('default')
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=POOL_CONNECTIONS,
+                pool_maxsize=POOL_MAXSIZE,
+                pool_block=POOL_BLOCK,
+                max_retries=0,
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions['default'] = session
+    return session
+
+
+# Retries of failed requests, configurable via environment variables
+RETRY_STATUSES = (500, 502, 504)  # Server errors worth retrying; 429/503 go through the rate limiter
+RETRY_BACKOFF = float(os.getenv("RETRY_BACKOFF", 0.5))  # Base backoff in seconds, doubled per retry
+RETRY_BACKOFF_MAX = float(os.getenv("RETRY_BACKOFF_MAX", 10))  # Cap on a single backoff in seconds
+
+
+def backoff_delay(attempt):
+    """
+    Return a full-jitter exponential backoff for the given retry attempt.
+
+    The delay is drawn uniformly from [0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2**attempt)],
+    so retries from many gauges failing together spread out instead of arriving in waves.
+    """
+    return random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2 ** attempt))
+
+
+def _sleep_before_retry(attempt, deadline=None):
+    """Sleep before retry `attempt`; return False instead if the run deadline would pass first."""
+    delay = backoff_delay(attempt)
+    if deadline is not None and deadline.remaining() <= delay:
+        return False
+    time.sleep(delay)
+    _add_timing('wait', delay)
+    return True
+
+
+def pool_stats():
+    """
+    Summarize connection reuse across all shared sessions.
+
+    Counts come from the urllib3 connection pools still held by the adapters;
+    every new connection to an HTTPS host is one TLS handshake.
+
+    Returns:
+        dict: 'requests', 'handshakes' and 'reused' counts.
+    """
+    requests_made = 0
+    handshakes = 0
+    with _session_lock:
+        sessions = list(_sessions.values())
+    for session in sessions:
+        adapters = {id(adapter): adapter for adapter in session.adapters.values()}
+        for adapter in adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                requests_made += pool.num_requests
+                handshakes += pool.num_connections
+    return {
+        'requests': requests_made,
+        'handshakes': handshakes,
+        'reused': max(requests_made - handshakes, 0),
+    }
+
+
+def close_sessions():
+    """Close every shared session and release pooled connections."""
+    with _session_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+# Per-host rate limiting, configurable via environment variables
+RATE_LIMIT_RPS = float(os.getenv("RATE_LIMIT_RPS", 20))  # Sustained requests/sec per host; 0 disables
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", 40))  # Requests allowed back to back before pacing starts
+THROTTLE_RETRIES = int(os.getenv("THROTTLE_RETRIES", 3))  # Retries of a 429/503 answer after backing off
+MAX_RETRY_AFTER = 60  # Longest Retry-After pause honored, in seconds
+
+
+class HostRateLimiter:
+    """
+    Token-bucket rate limiter shared by every fetch, with one bucket per host.
+
+    Each host starts at `rate` requests/sec with room for `burst` back-to-back
+    requests. A 429 or 503 halves that host's rate and pauses it for the
+    Retry-After period. Answers to requests that were already in flight when the
+    rate was cut only extend the pause, so one throttling episode halves the rate
+    once however many requests it catches. Every later success ramps the rate back up by a
+    twentieth of the configured rate, so the limiter settles near the highest
+    rate the host tolerates. Time spent waiting is accumulated for run metrics.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.min_rate = min(rate, 0.5)
+        self.lock = threading.Lock()
+        self.hosts = {}
+        self.wait_time = 0.0
+        self.throttled = 0
+
+    def _bucket(self, host, now):
+        bucket = self.hosts.get(host)
+        if bucket is None:
+            bucket = self.hosts[host] = {'tokens': float(self.burst), 'rate': self.rate,
+                                         'updated': now, 'paused_until': 0.0, 'slowed_at': float('-inf')}
+        else:
+            bucket['tokens'] = min(self.burst, bucket['tokens'] + (now - bucket['updated']) * bucket['rate'])
+            bucket['updated'] = now
+        return bucket
+
+    def acquire(self, host, deadline=None):
+        """
+        Block until a request to host is allowed.
+
+        Returns:
+            float: Seconds spent waiting.
+
+        Raises:
+            FetchCancelled: If the run deadline expires while waiting.
+        """
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                bucket = self._bucket(host, now)
+                if bucket['paused_until'] > now:
+                    delay = bucket['paused_until'] - now
+                elif bucket['tokens'] >= 1:
+                    bucket['tokens'] -= 1
+                    self.wait_time += waited
+                    return waited
+                else:
+                    delay = (1 - bucket['tokens']) / bucket['rate']
+            if deadline is not None:
+                if deadline.remaining() <= delay:
+                    with self.lock:
+                        self.wait_time += waited
+                    raise FetchCancelled(host)
+            time.sleep(delay)
+            waited += delay
+
+    def throttle(self, host, retry_after=None, sent_at=None):
+        """
+        Back off after host answered 429/503, pausing for retry_after seconds if given.
+
+        Args:
+            host (str): Host that answered.
+            retry_after (float): Retry-After delay in seconds, if the answer had one.
+            sent_at (float): time.monotonic() when the throttled request was sent; the
+                rate is only cut again for requests sent after the last cut.
+        """
+        if self.rate <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            bucket = self._bucket(host, now)
+            slowed = sent_at is None or sent_at >= bucket['slowed_at']
+            if slowed:
+                bucket['rate'] = max(self.min_rate, bucket['rate'] / 2)
+                bucket['slowed_at'] = now
+            bucket['tokens'] = 0.0
+            pause = retry_after if retry_after is not None else 1 / bucket['rate']
+            bucket['paused_until'] = max(bucket['paused_until'], now + min(pause, MAX_RETRY_AFTER))
+            self.throttled += 1
+        if slowed:
+            logger.warning(f"{host} is throttling requests, slowing to {bucket['rate']:.1f} req/s")
+
+    def succeeded(self, host):
+        """Ramp host back toward the configured rate after a successful request."""
+        if self.rate <= 0:
+            return
+        with self.lock:
+            bucket = self._bucket(host, time.monotonic())
+            bucket['rate'] = min(self.rate, bucket['rate'] + self.rate / 20)
+
+    def stats(self):
+        """Return wait time, throttled responses and current per-host rates since the last reset."""
+        with self.lock:
+            return {
+                'wait_time': self.wait_time,
+                'throttled': self.throttled,
+                'rates': {host: bucket['rate'] for host, bucket in self.hosts.items()},
+            }
+
+    def reset_stats(self):
+        """Zero the wait time and throttle counters (per-host rates are kept)."""
+        with self.lock:
+            self.wait_time = 0.0
+            self.throttled = 0
+
+
+def _retry_after(response):
+    """Return the Retry-After delay of a response in seconds, or None."""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    from email.utils import parsedate_to_datetime
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+rate_limiter = HostRateLimiter(RATE_LIMIT_RPS, RATE_LIMIT_BURST)
+
+
+# Persistent HTTP response cache, configurable via environment variables
+HTTP_CACHE_ENABLED = os.getenv("HTTP_CACHE", "1") == "1"
+HTTP_CACHE_DIR = os.getenv("HTTP_CACHE_DIR", "cache/http")
+HTTP_CACHE_TTL = int(os.getenv("HTTP_CACHE_TTL", 300))  # Seconds a cached body is used without revalidating
+cache_status = {}  # Last cache outcome ('hit', 'revalidated', 'miss') by gauge ID
+_fetch_state = threading.local()  # Cache status, observation time and outcome of the request running on this thread
+
+
+class HttpCache:
+    """
+    On-disk cache of response bodies keyed by URL.
+
+    Each entry is a JSON metadata file (validators, encoding, storage time) plus a
+    raw body file, both written atomically so concurrent runs never read a torn entry.
+    """
+
+    def __init__(self, directory, ttl):
+        self.directory = directory
+        self.ttl = ttl
+
+    def _paths(self, url):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.directory, key)
+        return base + '.json', base + '.body'
+
+    def load(self, url):
+        """Return the cached entry for url (with its 'body' bytes), or None."""
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path) as f:
+                entry = json.load(f)
+            with open(body_path, 'rb') as f:
+                entry['body'] = f.read()
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get('url') == url else None
+
+    def is_fresh(self, entry):
+        """Return True if entry is younger than the cache TTL."""
+        return time.time() - entry.get('stored_at', 0) < self.ttl
+
+    def store(self, url, body, response):
+        """Save body with the validators from response."""
+        entry = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'encoding': response.encoding,
+            'stored_at': time.time(),
+        }
+        meta_path, body_path = self._paths(url)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            _write_atomic(body_path, body)
+            _write_atomic(meta_path, json.dumps(entry).encode('utf-8'))
+        except OSError as e:
+            logger.warning(f"Failed to cache response for {url}: {e}")
+
+    def touch(self, url, entry):
+        """Restart the freshness window of an entry after a 304 Not Modified."""
+        entry = {k: v for k, v in entry.items() if k != 'body'}
+        entry['stored_at'] = time.time()
+        meta_path, _ = self._paths(url)
+        try:
+            _write_atomic(meta_path, json.dumps(entry).encode('utf-8'))
+        except OSError as e:
+            logger.warning(f"Failed to refresh cache entry for {url}: {e}")
+
+
+def _write_atomic(path, data):
+    """Write data to path via a temporary file and rename, so readers never see a partial file."""
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+http_cache = HttpCache(HTTP_CACHE_DIR, HTTP_CACHE_TTL)
+
+
+# Record/replay of gauge responses: REPLAY_MODE is '' (live), 'record' or 'replay'
+REPLAY_MODE = os.getenv("REPLAY_MODE", "")
+REPLAY_ARCHIVE = os.getenv("REPLAY_ARCHIVE", "replay/responses.jsonl.gz")
+REPLAY_LATENCY = os.getenv("REPLAY_LATENCY", "0") == "1"  # Sleep for each response's recorded latency
+
+
+class ResponseArchive:
+    """
+    Gzipped JSON-lines archive of gauge responses for deterministic, offline runs.
+
+    Each line holds the URL, HTTP status (0 for a connection failure), latency in
+    seconds, encoding and base64 body of one response. In replay mode, responses for
+    a URL are served in the order they were recorded, repeating the last one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.load_lock = threading.Lock()
+        self.loaded = False
+        self.records = []
+        self.by_url = {}
+        self.served = {}
+
+    def record(self, url, status, elapsed, encoding=None, body=b''):
+        """Append one response to the archive."""
+        with self.lock:
+            self.records.append({
+                'url': url,
+                'status': status,
+                'elapsed': round(elapsed, 6),
+                'encoding': encoding,
+                'body': base64.b64encode(body).decode('ascii'),
+            })
+
+    def save(self):
+        """Write every recorded response to the archive file."""
+        with self.lock:
+            records = list(self.records)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with gzip.open(self.path, 'wt', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, separators=(',', ':')) + '\n')
+        logger.info(f"Recorded {len(records)} responses to {self.path}")
+
+    def load(self):
+        """Read the archive file so responses can be replayed."""
+        by_url = {}
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                record['body'] = base64.b64decode(record['body'])
+                by_url.setdefault(record['url'], []).append(record)
+        with self.lock:
+            self.by_url = by_url
+            self.served = {}
+            self.loaded = True
+        logger.info(f"Loaded {sum(len(r) for r in by_url.values())} recorded responses from {self.path}")
+
+    def next_response(self, url):
+        """Return the next recorded response for url, or None if it was never recorded."""
+        with self.load_lock:
+            if not self.loaded and os.path.exists(self.path):
+                self.load()
+        with self.lock:
+            records = self.by_url.get(url)
+            if not records:
+                return None
+            index = self.served.get(url, 0)
+            self.served[url] = index + 1
+            return records[min(index, len(records) - 1)]
+
+
+response_archive = ResponseArchive(REPLAY_ARCHIVE)
+
+
+def _replay_response(url):
+    """Return (chunk iterator, encoding) for a recorded response, raising like a live request would."""
+    record = response_archive.next_response(url)
+    if record is None:
+        raise requests.exceptions.ConnectionError(f"No recorded response for {url}")
+    if REPLAY_LATENCY:
+        time.sleep(record['elapsed'])
+    if record['status'] == 0:
+        raise requests.exceptions.ConnectionError(f"Recorded connection failure for {url}")
+    if record['status'] >= 400:
+        raise requests.exceptions.HTTPError(f"{record['status']} Error (replayed) for url: {url}")
+    return iter([record['body']]), record['encoding']
+
+
+@contextmanager
+def open_url(session, url, timeout, deadline=None, retries=0):
+    """
+    Open url and yield (chunk iterator, encoding), serving from the HTTP cache when possible.
+
+    A fresh cache entry is returned without any request. A stale entry is revalidated
+    with If-None-Match/If-Modified-Since and reused on 304. Requests are paced by
+    rate_limiter, and 429/503 answers are retried after the limiter backs off and
+    any Retry-After pause. Connection errors, timeouts and 500/502/504 answers are
+    retried up to `retries` times with full-jitter backoff, as long as the run
+    deadline leaves room for the pause. Otherwise the response is
+    streamed, and the bytes the caller consumed are cached for the next run; when the
+    caller stops early that is a prefix of the body, which is all a later read needs.
+    The outcome is left in _fetch_state.cache_status for get_water_level to record.
+
+    With REPLAY_MODE=replay responses come from response_archive instead of the network
+    or cache; with REPLAY_MODE=record the cache is bypassed and every response is read
+    in full and added to the archive.
+
+    If a deadline is given, reading stops with FetchCancelled once it expires.
+    """
+    if REPLAY_MODE == 'replay':
+        _fetch_state.cache_status = None
+        yield _replay_response(url)
+        return
+
+    recording = REPLAY_MODE == 'record'
+    use_cache = HTTP_CACHE_ENABLED and not recording
+    entry = http_cache.load(url) if use_cache else None
+    if entry is not None and http_cache.is_fresh(entry):
+        _fetch_state.cache_status = 'hit'
+        yield iter([entry['body']]), entry.get('encoding')
+        return
+
+    headers = {}
+    if entry is not None:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+    host = urlsplit(url).netloc
+    started = time.perf_counter()
+    retried = 0
+    throttled = 0
+    while True:
+        _add_timing('wait', rate_limiter.acquire(host, deadline))
+        sent = time.perf_counter()
+        sent_at = time.monotonic()  # Same instant on the rate limiter's clock
+        try:
+            response = session.get(url, timeout=timeout, stream=True, headers=headers)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            _add_timing('ttfb', time.perf_counter() - sent)
+            if retried < retries and _sleep_before_retry(retried, deadline):
+                retried += 1
+                continue
+            if recording:
+                response_archive.record(url, 0, time.perf_counter() - started)
+            raise
+        except requests.exceptions.RequestException:
+            if recording:
+                response_archive.record(url, 0, time.perf_counter() - started)
+            raise
+        _add_timing('ttfb', time.perf_counter() - sent)
+        if response.status_code in (429, 503):
+            retry_after = _retry_after(response)
+            rate_limiter.throttle(host, retry_after, sent_at)
+            if throttled < THROTTLE_RETRIES:
+                if rate_limiter.rate <= 0:  # No limiter pausing the host, so back off here
+                    delay = min(retry_after if retry_after is not None else backoff_delay(throttled),
+                                MAX_RETRY_AFTER)
+                    if deadline is not None and deadline.remaining() <= delay:
+                        break
+                    time.sleep(delay)
+                    _add_timing('wait', delay)
+                throttled += 1
+                response.close()
+                continue
+            break
+        rate_limiter.succeeded(host)
+        if response.status_code in RETRY_STATUSES and retried < retries \
+                and _sleep_before_retry(retried, deadline):
+            retried += 1
+            response.close()
+            continue
+        break
+    try:
+        if response.status_code == 304 and entry is not None:
+            _fetch_state.cache_status = 'revalidated'
+            http_cache.touch(url, entry)
+            yield iter([entry['body']]), entry.get('encoding')
+            return
+        if recording and response.status_code >= 400:
+            response_archive.record(url, response.status_code, time.perf_counter() - started,
+                                    response.encoding, response.content)
+        response.raise_for_status()
+        _fetch_state.cache_status = 'miss' if use_cache else None
+
+        consumed = []
+
+        def chunks():
+            body = response.iter_content(CHUNK_SIZE)
+            while True:
+                read_started = time.perf_counter()
+                chunk = next(body, None)
+                _add_timing('download', time.perf_counter() - read_started)
+                if chunk is None:
+                    return
+                if deadline is not None and deadline.expired():
+                    raise FetchCancelled(url)
+                _add_timing('bytes', len(chunk))
+                consumed.append(chunk)
+                yield chunk
+
+        body_chunks = chunks()
+        yield body_chunks, response.encoding
+        if recording:
+            for _ in body_chunks:  # Read the rest so the archive holds the whole body
+                pass
+            response_archive.record(url, response.status_code, time.perf_counter() - started,
+                                    response.encoding, b''.join(consumed))
+        if use_cache:
+            http_cache.store(url, b''.join(consumed), response)
+    finally:
+        _release_response(response)
+
+
+# Precompiled byte pattern for the observed stage embedded in gauge pages
+OBSERVED_PRIMARY = re.compile(rb'"ObservedPrimary":(-?\d+\.\d*)')
+OBSERVED_TIME = re.compile(rb'"(?:ObservedTime|validTime)":"([^"]+)"')  # Time of the observed stage, when the page has one
+CHUNK_SIZE = 16384  # Bytes read from the response per iteration
+DRAIN_LIMIT = int(os.getenv("EXTRACT_DRAIN_LIMIT", 65536))  # Max unread bytes drained to keep a connection pooled
+
+
+def extract_observed_primary(chunks):
+    """
+    Scan raw response bytes for the "ObservedPrimary" value without decoding or parsing HTML.
+
+    Stops consuming `chunks` as soon as a complete value is found. A match that ends
+    exactly at the end of the data read so far is only accepted once more bytes (or
+    the end of the body) confirm the number was not cut off mid-chunk.
+
+    Args:
+        chunks (iterable): Byte strings making up the response body.
+
+    Returns:
+        tuple: (float or None, bytes read so far). On a miss the bytes are the full body.
+    """
+    buffer = bytearray()
+    scan_from = 0
+    for chunk in chunks:
+        buffer += chunk
+        match = OBSERVED_PRIMARY.search(buffer, scan_from)
+        if match and match.end() < len(buffer):
+            return float(match.group(1)), bytes(buffer)
+        # Rescan a small tail so a key split across chunks is still found
+        scan_from = max(0, len(buffer) - 64)
+    match = OBSERVED_PRIMARY.search(buffer)
+    return (float(match.group(1)) if match else None), bytes(buffer)
+
+
+def extract_observed_time(body):
+    """
+    Find the observation time that belongs to the "ObservedPrimary" value in a gauge page.
+
+    Only a time among the keys of the same JSON object as the value is taken, i.e.
+    between the nearest braces on either side of it, so a time series or another
+    widget elsewhere on the page is never mistaken for it.
+
+    Args:
+        body (bytes): Page bytes read so far.
+
+    Returns:
+        datetime: The observation time, or None if the value's object has none
+            (or was not read in full).
+    """
+    match = OBSERVED_PRIMARY.search(body)
+    if not match:
+        return None
+    start = max(body.rfind(b'{', 0, match.start()), body.rfind(b'}', 0, match.start()))
+    ends = [end for end in (body.find(b'}', match.end()), body.find(b'{', match.end())) if end >= 0]
+    if start < 0 or not ends:
+        return None
+    found = OBSERVED_TIME.search(body, start, min(ends))
+    return parse_observation_time(found.group(1).decode('ascii', 'replace')) if found else None
+
+
+def parse_observation_time(text):
+    """
+    Parse a source's ISO 8601 observation time (e.g. NWPS validTime '2025-06-01T14:00:00Z').
+
+    Args:
+        text (str): Timestamp; a trailing 'Z' means UTC.
+
+    Returns:
+        datetime: The time, or None if `text` is empty or not a timestamp.
+    """
+    if not text:
+        return None
+    try:
+        return datetime.fromisoformat(text[:-1] + '+00:00' if text.endswith('Z') else text)
+    except ValueError:
+        return None
+
+
+def parse_observed_primary_html(text):
+    """
+    Find the "ObservedPrimary" value by parsing the full page with BeautifulSoup.
+
+    This is the original extraction path, used as a fallback when the byte-level
+    scan in extract_observed_primary misses.
+
+    Args:
+        text (str): Decoded page HTML.
+
+    Returns:
+        float: Water level if found, else None.
+    """
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(text, 'html.parser')
+    # Robust regex to handle negative numbers and varying decimals
+    value = re.search(r'"ObservedPrimary":-?\d+\.\d*', soup.prettify())
+    # value = re.search(r'"ObservedPrimary":-?\d+\.\d{1,}', soup.prettify())
+    if value:
+        return float(value.group().split(':')[1])
+    return None
+
+
+def _release_response(response):
+    """
+    Release a streamed response, keeping its connection pooled when that is cheap.
+
+    A response closed with unread data loses its connection, so small remainders are
+    drained first; large or unknown-length remainders are dropped with the socket.
+    """
+    raw = response.raw
+    length = response.headers.get('Content-Length', '')
+    if length.isdigit() and int(length) - raw.tell() <= DRAIN_LIMIT:
+        try:
+            raw.drain_conn()
+            raw.release_conn()
+            return
+        except Exception:
+            pass
+    response.close()
+
+
+def _html_water_level(session, url, timeout, deadline=None, retries=0):
+    """
+    Read the observed stage from a water.noaa.gov gauge page.
+
+    The body is streamed through extract_observed_primary and reading stops once
+    the value is found; the full BeautifulSoup parse only runs when the byte scan misses.
+    The value's observation time, if its JSON object has one, is left in
+    _fetch_state.observed_at.
+    """
+    with open_url(session, url, timeout, deadline, retries) as (chunks, encoding):
+        value, body = extract_observed_primary(chunks)
+    if value is None:
+        value = parse_observed_primary_html(body.decode(encoding or 'utf-8', errors='replace'))
+    _fetch_state.observed_at = extract_observed_time(body)
+    return value
+
+
+def _nwps_water_level(session, url, timeout, deadline=None, retries=0):
+    """
+    Read the latest observed stage for a gauge from the NWPS stageflow JSON API.
+
+    The gauge ID is taken from the gauge page URL in the source CSV, so the same
+    catalogs work with either source. The observation's validTime is left in
+    _fetch_state.observed_at.
+    """
+    api_url = f"{NWPS_API_URL.rstrip('/')}/gauges/{gauge_id(url)}/stageflow/observed"
+    with open_url(session, api_url, timeout, deadline, retries) as (chunks, _):
+        document = json.loads(b''.join(chunks))
+    # Observations are oldest first; NWPS reports missing values as -999
+    for observation in reversed(document.get('data') or []):
+        primary = observation.get('primary')
+        if primary is not None and primary > NWPS_MISSING:
+            _fetch_state.observed_at = parse_observation_time(observation.get('validTime'))
+            return float(primary)
+    return None
+
+
+# Gauge data sources; GAUGE_SOURCE selects which one get_water_level uses
+SOURCE_ADAPTERS = {
+    'html': _html_water_level,
+    'nwps': _nwps_water_level,
+}
+GAUGE_SOURCE = os.getenv("GAUGE_SOURCE", "html")
+NWPS_API_URL = os.getenv("NWPS_API_URL", "https://api.water.noaa.gov/nwps/v1")
+NWPS_MISSING = -999
+
+# Per-gauge circuit breaker, configurable via environment variables
+BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", 3))  # Consecutive failed fetches that open a circuit; 0 disables
+BREAKER_COOLDOWN = int(os.getenv("BREAKER_COOLDOWN", 3600))  # Seconds a gauge is skipped before a probe request
+BREAKER_STATE = os.getenv("BREAKER_STATE", "cache/breakers.json")
+BREAKER_HOST_WINDOW = int(os.getenv("BREAKER_HOST_WINDOW", 60))  # Seconds a host counts as up after it served a gauge
+CIRCUIT_OPEN = "No Data (circuit open)"  # Report value for gauges skipped by an open circuit
+
+
+class CircuitBreaker:
+    """
+    Per-gauge circuit breaker that remembers failures across runs.
+
+    A gauge whose fetch fails `threshold` times in a row for reasons of its own
+    (404/410 answers, pages without an observed stage, timeouts and server
+    errors while its host is serving other gauges) is skipped for `cooldown`
+    seconds. After the cool-down one probe request is let through: success
+    closes the circuit, failure opens it for another cool-down. Host-wide
+    failures (connection errors, throttling, a host that has not served any
+    gauge in the last `host_window` seconds) and fetches cut off by the run
+    deadline count as neither, so an outage does not open every circuit. State
+    is kept in a JSON file keyed by gauge ID, with wall-clock timestamps so it
+    survives restarts.
+    """
+
+    def __init__(self, path, threshold, cooldown, host_window=BREAKER_HOST_WINDOW):
+        self.path = path
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.host_window = host_window
+        self.hosts = {}  # Host -> time it last served a gauge
+        self.lock = threading.Lock()
+        self.gauges = None
+        self.probing = set()
+        self.dirty = False
+
+    def _load(self):
+        # Called with self.lock held
+        if self.gauges is not None:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                self.gauges = json.load(file)
+        except FileNotFoundError:
+            self.gauges = {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable circuit breaker state {self.path}: {e}")
+            self.gauges = {}
+
+    def allow(self, gauge):
+        """Return True if gauge may be fetched now (closed circuit, or the half-open probe)."""
+        if self.threshold <= 0:
+            return True
+        with self.lock:
+            self._load()
+            state = self.gauges.get(gauge)
+            if state is None or state.get('opened_at') is None:
+                return True
+            if time.time() - state['opened_at'] < self.cooldown or gauge in self.probing:
+                return False
+            self.probing.add(gauge)
+        logger.info(f"Circuit for gauge {gauge} is half open, sending a probe request")
+        return True
+
+    def succeeded(self, gauge, host=None):
+        """Close the circuit for gauge and forget its failures, noting that `host` is up."""
+        if self.threshold <= 0:
+            return
+        with self.lock:
+            if host:
+                self.hosts[host] = time.time()
+            self._load()
+            self.probing.discard(gauge)
+            state = self.gauges.pop(gauge, None)
+            if state is None:
+                return
+            self.dirty = True
+        if state.get('opened_at') is not None:
+            logger.info(f"Circuit for gauge {gauge} closed, the gauge is answering again")
+
+    def failed(self, gauge):
+        """Count a failed fetch of gauge, opening its circuit at the threshold."""
+        if self.threshold <= 0:
+            return
+        with self.lock:
+            self._load()
+            probe = gauge in self.probing
+            self.probing.discard(gauge)
+            state = self.gauges.setdefault(gauge, {'failures': 0, 'opened_at': None})
+            state['failures'] += 1
+            opened = probe or (state['opened_at'] is None and state['failures'] >= self.threshold)
+            if opened:
+                state['opened_at'] = time.time()
+            self.dirty = True
+        if opened:
+            logger.warning(f"Circuit for gauge {gauge} opened after {state['failures']} consecutive failures, "
+                           f"skipping it for {self.cooldown}s")
+
+    def host_up(self, host):
+        """Return True if host served a gauge within the last host_window seconds."""
+        with self.lock:
+            return time.time() - self.hosts.get(host, float('-inf')) < self.host_window
+
+    def abandoned(self, gauge):
+        """Release a probe that ended without an answer about the gauge itself."""
+        with self.lock:
+            self.probing.discard(gauge)
+
+    def open_gauges(self):
+        """Return the IDs of gauges whose circuit is currently open."""
+        with self.lock:
+            self._load()
+            return sorted(gauge for gauge, state in self.gauges.items() if state.get('opened_at') is not None)
+
+    def save(self):
+        """Write the breaker state to disk if it changed since the last save."""
+        with self.lock:
+            if not self.dirty:
+                return
+            data = json.dumps(self.gauges, indent=1, sort_keys=True).encode('utf-8')
+            self.dirty = False
+        try:
+            _write_atomic(self.path, data)
+        except OSError as e:
+            logger.warning(f"Could not save circuit breaker state to {self.path}: {e}")
+
+
+circuit_breaker = CircuitBreaker(BREAKER_STATE, BREAKER_THRESHOLD, BREAKER_COOLDOWN)
+
+# Hedged requests, configurable via environment variables
+HEDGE_ENABLED = os.getenv("HEDGE", "0") == "1"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", 90))  # Latency percentile after which a duplicate is sent
+HEDGE_WINDOW = 200  # Recent fetch latencies the percentile is taken over
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", 20))  # Fetches observed before hedging starts
+HEDGE_RATIO = float(os.getenv("HEDGE_RATIO", 0.1))  # Max hedged fetches as a fraction of all fetches
+HEDGE_MAX_INFLIGHT = int(os.getenv("HEDGE_MAX_INFLIGHT", 4))  # Max duplicate requests in flight at once
+
+
+class Hedger:
+    """
+    Sends a duplicate of a gauge request that is slower than usual and keeps the first answer.
+
+    Latencies of recent network fetches are kept in a ring buffer. A fetch that
+    has not finished after the `percentile` latency of that window gets a second
+    attempt; whichever attempt returns a water level first wins and the other is
+    cancelled through its own child Deadline. The extra load is capped twice:
+    hedges may not exceed `ratio` of all fetches, and at most `max_inflight`
+    duplicates run at any moment.
+    """
+
+    def __init__(self, enabled, percentile, window, min_samples, ratio, max_inflight):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.ratio = ratio
+        self.max_inflight = max_inflight
+        self.latencies = deque(maxlen=window)
+        self.lock = threading.Lock()
+        self.pool = None
+        self.inflight = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Zero the fetch and hedge counters (the latency window is kept)."""
+        with self.lock:
+            self.fetches = 0
+            self.hedged = 0
+            self.won = 0
+
+    def stats(self):
+        """Return fetch and hedge counts since the last reset and the current hedge delay."""
+        with self.lock:
+            return {'fetches': self.fetches, 'hedged': self.hedged, 'won': self.won, 'delay': self._delay()}
+
+    def _delay(self):
+        # Called with self.lock held
+        if len(self.latencies) < self.min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))]
+
+    def _start_hedge(self):
+        with self.lock:
+            if self.inflight >= self.max_inflight or self.hedged + 1 > self.ratio * self.fetches:
+                return False
+            self.hedged += 1
+            self.inflight += 1
+            return True
+
+    def _hedge_done(self, future):
+        with self.lock:
+            self.inflight -= 1
+
+    def _get_pool(self):
+        with self.lock:
+            if self.pool is None:
+                # Room for every caller's attempt plus the losing attempts still winding down
+                workers = 2 * max(FETCH_CONCURRENCY, FETCH_WORKERS) + self.max_inflight
+                self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hedge')
+            return self.pool
+
+    def shutdown(self):
+        """Stop the attempt threads, dropping attempts that have not started."""
+        with self.lock:
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def fetch(self, attempt, deadline=None):
+        """
+        Run attempt(attempt_deadline), hedging it with a second call if it is slow.
+
+        Args:
+            attempt (callable): Performs one fetch given its own Deadline and returns
+                (water level or None, HTTP cache status, fetch timings).
+            deadline (Deadline): Optional run-wide time budget.
+
+        Returns:
+            tuple: The winning attempt's result. If no attempt found a water level
+                the first attempt's outcome is returned or raised.
+        """
+        pool = self._get_pool()
+        started = time.perf_counter()
+        with self.lock:
+            self.fetches += 1
+            delay = self._delay()
+        attempts = {}
+        primary_deadline = Deadline(float('inf'), parent=deadline)
+        primary = pool.submit(attempt, primary_deadline)
+        attempts[primary] = primary_deadline
+        pending = {primary}
+        hedge = None
+        if delay is not None:
+            done, pending = wait(pending, timeout=delay)
+            if not done and self._start_hedge():
+                hedge_deadline = Deadline(float('inf'), parent=deadline)
+                hedge = pool.submit(attempt, hedge_deadline)
+                hedge.add_done_callback(self._hedge_done)
+                attempts[hedge] = hedge_deadline
+                pending.add(hedge)
+
+        winner = None
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None and future.result()[0] is not None:
+                    winner = future
+                    break
+        for future, attempt_deadline in attempts.items():
+            if future is not winner:
+                attempt_deadline.cancel()
+
+        if winner is None:
+            return primary.result()
+        result = winner.result()
+        if result[1] != 'hit':
+            with self.lock:
+                self.latencies.append(time.perf_counter() - started)
+                if winner is hedge:
+                    self.won += 1
+        return result
+
+
+hedger = Hedger(HEDGE_ENABLED, HEDGE_PERCENTILE, HEDGE_WINDOW, HEDGE_MIN_SAMPLES, HEDGE_RATIO, HEDGE_MAX_INFLIGHT)
+
+
+def get_water_level(url, max_retries=3, source=None, deadline=None):
+    """
+    Fetch water level from the given URL with retry logic.
+
+    Uses the shared pooled session from get_session, so repeated calls reuse
+    open connections to the same host. The request is made by the source adapter
+    named by `source` (default GAUGE_SOURCE): 'html' scrapes the gauge page,
+    'nwps' reads the NWPS JSON API for the same gauge. With a run deadline the
+    request timeout is clamped to the remaining budget and the fetch is abandoned
+    once the budget runs out. With HEDGE=1 a slow request is raced against a
+    duplicate by hedger. Successes and gauge-specific failures (see
+    _gauge_failure) are reported to circuit_breaker; host-wide failures and
+    abandoned fetches are not. Its time, phase split and bytes
+    are recorded in run_metrics.
+
+    Args:
+        url (str): URL to fetch data from.
+        max_retries (int): Number of retries after a connection error, timeout or server error.
+        source (str): Source adapter to use ('html' or 'nwps').
+        deadline (Deadline): Optional run-wide time budget.
+
+    Returns:
+        float: Water level if found, else None.
+    """
+    session = get_session()
+    source = source or GAUGE_SOURCE
+    adapter = SOURCE_ADAPTERS.get(source)
+    if adapter is None:
+        logger.error(f"Unknown gauge source '{source}'")
+        return None
+
+    gauge = gauge_id(url)
+    host = urlsplit(NWPS_API_URL if source == 'nwps' else url).netloc
+    started = time.perf_counter()
+    outcome = 'error'
+    gauge_fault = True  # Whether a failure is the gauge's own rather than its host's
+    _fetch_state.cache_status = None
+    _fetch_state.observed_at = None
+    _fetch_state.timings = _new_timings()
+    try:
+        if deadline is not None and deadline.expired():
+            raise FetchCancelled(url)
+        if hedger.enabled:
+            def attempt(attempt_deadline):
+                _fetch_state.cache_status = None
+                _fetch_state.observed_at = None
+                _fetch_state.timings = _new_timings()
+                value = adapter(session, url, attempt_deadline.timeout(REQUEST_TIMEOUT), attempt_deadline, max_retries)
+                return value, _fetch_state.cache_status, _fetch_state.observed_at, _fetch_state.timings
+
+            value, _fetch_state.cache_status, _fetch_state.observed_at, _fetch_state.timings = \
+                hedger.fetch(attempt, deadline)
+        else:
+            timeout = deadline.timeout(REQUEST_TIMEOUT) if deadline is not None else REQUEST_TIMEOUT
+            value = adapter(session, url, timeout, deadline, max_retries)
+        if value is not None:
+            outcome = 'ok'
+            return value
+        else:
+            outcome = 'no_value'
+            logger.warning(f"No observed water level found at {url} ({source} source)")
+            return None
+    except FetchCancelled:
+        outcome = 'cancelled'
+        if deadline is not None and not deadline.expired():
+            logger.warning(f"Not enough of the run deadline left to fetch {url}, abandoned")
+        else:
+            logger.warning(f"Run deadline reached, abandoned fetch of {url}")
+        return None
+    except requests.exceptions.RequestException as e:
+        if deadline is not None and deadline.expired():
+            outcome = 'cancelled'
+            logger.warning(f"Run deadline reached, abandoned fetch of {url}")
+        else:
+            logger.error(f"Failed to fetch data from {url}: {e}")
+            gauge_fault = _gauge_failure(e, circuit_breaker.host_up(host))
+        return None
+    except Exception as e:
+        logger.error(f"Unexpected error while processing {url}: {e}")
+        return None
+    finally:
+        if REPLAY_MODE != 'replay':  # Replays neither read nor change the live breaker state
+            if outcome == 'ok':
+                circuit_breaker.succeeded(gauge, host)
+            elif outcome != 'cancelled' and gauge_fault:
+                circuit_breaker.failed(gauge)
+            else:
+                circuit_breaker.abandoned(gauge)
+        cache_status[gauge] = _fetch_state.cache_status
+        _fetch_state.outcome = outcome
+        run_metrics.record_fetch(gauge, time.perf_counter() - started, outcome,
+                                 _fetch_state.cache_status, _fetch_state.timings)
+        _fetch_state.timings = None
+
+
+def _gauge_failure(error, host_up):
+    """
+    Decide whether a failed request is the gauge's own failure or its host's.
+
+    Connection errors and throttling (429/503) are host-wide. Other 4xx answers
+    (404, 410) are the gauge's. Timeouts and server errors only count against
+    the gauge while the host is serving other gauges.
+
+    Args:
+        error (RequestException): The error the fetch ended with.
+        host_up (bool): Whether the host served another gauge recently.
+
+    Returns:
+        bool: True if the failure should count towards the gauge's circuit.
+    """
+    response = getattr(error, 'response', None)
+    if isinstance(error, requests.exceptions.HTTPError) and response is not None:
+        if response.status_code in (429, 503):
+            return False
+        return response.status_code < 500 or host_up
+    if isinstance(error, requests.exceptions.ConnectionError):
+        return False
+    return host_up
+
+
+def fetch_gauge(url, deadline):
+    """
+    Fetch one gauge for a report, within the run deadline and its circuit breaker.
+
+    A fetched reading is recorded in observation_store, and the report gets the
+    gauge's newest stored reading. Replayed responses are not recorded, and
+    replays skip the circuit breaker so every replay of a run gives the same report.
+
+    Returns:
+        float: Water level, None if the fetch failed, CIRCUIT_OPEN if the gauge is
+            being skipped after repeated failures, or TIMED_OUT if the deadline
+            expired, or would have before the fetch could finish.
+    """
+    if deadline.expired():
+        return TIMED_OUT
+    if REPLAY_MODE != 'replay' and not circuit_breaker.allow(gauge_id(url)):
+        return CIRCUIT_OPEN
+    _fetch_state.outcome = None
+    value = get_water_level(url, deadline=deadline)
+    if value is None and (deadline.expired() or _fetch_state.outcome == 'cancelled'):
+        return TIMED_OUT
+    if value is not None and REPLAY_MODE != 'replay':
+        value = observation_store.record(gauge_id(url), value, _fetch_state.observed_at,
+                                         cached=_fetch_state.cache_status == 'hit')
+    return value
+
+
+# Observation history: one row per (gauge, observation time), configurable via environment variables
+OBSERVATION_DB = os.getenv("OBSERVATION_DB", "data/observations.db")  # SQLite database; empty disables
+OBSERVATION_BATCH = int(os.getenv("OBSERVATION_BATCH", 500))  # Readings buffered per INSERT transaction
+
+
+class ObservationStore:
+    """
+    SQLite (WAL mode) store of gauge readings keyed by (gauge ID, observation time).
+
+    Readings are buffered by add() and written with one batched INSERT OR IGNORE
+    per OBSERVATION_BATCH readings (and on flush()), so each run appends only the
+    new values rather than another copy of the catalog. The primary key doubles
+    as the index for per-gauge range queries. Observation times are stored as
+    UTC to the second ('2025-11-02T06:30:00Z'), so readings stay distinct and
+    ordered across daylight saving changes, and are returned by range() and
+    latest() as local times. record() keys a fetched reading on the time the
+    source gives for it, so refetching an observation adds nothing. The newest
+    reading of each gauge seen is kept in memory for record(). The database is
+    opened on first use.
+    """
+
+    def __init__(self, path, batch_size):
+        self.path = path
+        self.batch_size = batch_size
+        self.pending = []
+        self.newest = {}  # Gauge ID -> newest (observed_at, value) stored, or None if it has none
+        self.lock = threading.Lock()
+        self.connection = None
+
+    def _connect(self):
+        if self.connection is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS observations ('
+                               'gauge_id TEXT NOT NULL, observed_at TEXT NOT NULL, value REAL NOT NULL, '
+                               'PRIMARY KEY (gauge_id, observed_at)) WITHOUT ROWID')
+            if connection.execute('PRAGMA user_version').fetchone()[0] < 1:
+                self._migrate_local_times(connection)
+            self.connection = connection
+        return self.connection
+
+    @staticmethod
+    def _migrate_local_times(connection):
+        # Stores written before keys moved to UTC hold naive local times
+        legacy = connection.execute(
+            "SELECT gauge_id, observed_at, value FROM observations WHERE observed_at NOT LIKE '%Z'").fetchall()
+        with connection:
+            connection.execute("DELETE FROM observations WHERE observed_at NOT LIKE '%Z'")
+            connection.executemany('INSERT OR IGNORE INTO observations VALUES (?, ?, ?)',
+                                   [(gauge, _stored_time(datetime.fromisoformat(observed_at)), value)
+                                    for gauge, observed_at, value in legacy])
+            connection.execute('PRAGMA user_version = 1')
+
+    def add(self, gauge, value, observed_at=None):
+        """
+        Buffer one reading, writing the batch once it is full.
+
+        Args:
+            gauge (str): Gauge ID.
+            value (float): Water level.
+            observed_at (datetime): Observation time (default now).
+        """
+        if not self.path:
+            return
+        with self.lock:
+            self._add(gauge, value, _stored_time(observed_at or datetime.now()))
+
+    def record(self, gauge, value, observed_at=None, cached=False):
+        """
+        Add a freshly fetched reading unless the store already has it.
+
+        A reading without an observation time from the source is stored at the
+        fetch time, and skipped when it came from the HTTP cache or repeats the
+        gauge's newest stored value.
+
+        Args:
+            gauge (str): Gauge ID.
+            value (float): Water level.
+            observed_at (datetime): Observation time given by the source, if any.
+            cached (bool): The value was read from a fresh HTTP cache entry.
+
+        Returns:
+            float: The gauge's newest stored reading, which is `value` unless the
+                store already holds a later observation.
+        """
+        if not self.path:
+            return value
+        with self.lock:
+            newest = self._newest(gauge)
+            if observed_at is None and newest is not None and (cached or newest[1] == value):
+                return newest[1]
+            self._add(gauge, value, _stored_time(observed_at or datetime.now()))
+            newest = self.newest.get(gauge)
+            return newest[1] if newest is not None else value
+
+    def _add(self, gauge, value, observed_at):
+        self.pending.append((gauge, observed_at, value))
+        if gauge in self.newest and (self.newest[gauge] is None or observed_at >= self.newest[gauge][0]):
+            self.newest[gauge] = (observed_at, value)
+        if len(self.pending) >= self.batch_size:
+            self._write()
+
+    def preload(self, gauges):
+        """
+        Load the newest stored reading of every gauge a run is about to fetch, in one query.
+
+        record() then needs no database access for those gauges, so fetch workers
+        only meet on the store when a full OBSERVATION_BATCH is written.
+
+        Args:
+            gauges (iterable): Gauge IDs.
+        """
+        if not self.path:
+            return
+        with self.lock:
+            self._load_newest([gauge for gauge in set(gauges) if gauge not in self.newest])
+
+    def _newest(self, gauge):
+        if gauge not in self.newest:
+            self._load_newest([gauge])
+        return self.newest.get(gauge)
+
+    def _load_newest(self, gauges):
+        # Called with self.lock held; buffered readings are folded in rather than written first
+        if not gauges:
+            return
+        found = {}
+        try:
+            connection = self._connect()
+            for start in range(0, len(gauges), 500):  # Stay under SQLite's bound parameter limit
+                chunk = gauges[start:start + 500]
+                rows = connection.execute(
+                    f'SELECT gauge_id, MAX(observed_at), value FROM observations '
+                    f'WHERE gauge_id IN ({", ".join("?" * len(chunk))}) GROUP BY gauge_id', chunk)
+                found.update((gauge, (observed_at, value)) for gauge, observed_at, value in rows)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to read observations from {self.path}: {e}")
+            return
+        wanted = set(gauges)
+        for gauge, observed_at, value in self.pending:
+            if gauge in wanted and (gauge not in found or observed_at >= found[gauge][0]):
+                found[gauge] = (observed_at, value)
+        for gauge in gauges:
+            self.newest[gauge] = found.get(gauge)
+
+    def flush(self):
+        """Write every buffered reading."""
+        if not self.path:
+            return
+        with self.lock:
+            self._write()
+
+    def _write(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        try:
+            with self._connect() as connection:
+                connection.executemany('INSERT OR IGNORE INTO observations VALUES (?, ?, ?)', batch)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to store {len(batch)} observations in {self.path}: {e}")
+
+    def range(self, gauge, start=None, end=None):
+        """
+        Read a gauge's readings between two times.
+
+        Args:
+            gauge (str): Gauge ID.
+            start (datetime): Earliest observation time (default no lower bound).
+            end (datetime): Latest observation time (default no upper bound).
+
+        Returns:
+            list: (observed_at, value) tuples, oldest first, with observed_at as a local datetime.
+        """
+        if not self.path:
+            return []
+        start = _stored_time(start) if start else ''
+        end = _stored_time(end) if end else '9999'
+        with self.lock:
+            self._write()
+            rows = self._connect().execute(
+                'SELECT observed_at, value FROM observations '
+                'WHERE gauge_id = ? AND observed_at BETWEEN ? AND ? ORDER BY observed_at',
+                (gauge, start, end)).fetchall()
+        return [(_local_time(observed_at), value) for observed_at, value in rows]
+
+    def latest(self, gauges, at=None):
+        """
+        Find the most recent reading of each gauge.
+
+        Args:
+            gauges (iterable): Gauge IDs.
+            at (datetime): Ignore readings after this time (default no limit).
+
+        Returns:
+            dict: Gauge ID -> (observed_at, value) for gauges with a reading, with
+                observed_at as a local datetime.
+        """
+        if not self.path:
+            return {}
+        at = _stored_time(at) if at else '9999'
+        readings = {}
+        with self.lock:
+            self._write()
+            connection = self._connect()
+            for gauge in set(gauges):
+                row = connection.execute(
+                    'SELECT observed_at, value FROM observations WHERE gauge_id = ? AND observed_at <= ? '
+                    'ORDER BY observed_at DESC LIMIT 1', (gauge, at)).fetchone()
+                if row:
+                    readings[gauge] = (_local_time(row[0]), row[1])
+        return readings
+
+    def close(self):
+        """Write buffered readings and close the database."""
+        with self.lock:
+            if self.pending:
+                self._write()
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+            self.newest.clear()
+
+
+def _stored_time(moment):
+    """Format a datetime as the store's UTC key; naive times are taken as local time."""
+    return moment.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _local_time(key):
+    """Turn a stored UTC key back into an aware local datetime."""
+    return datetime.strptime(key, '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc).astimezone()
+
+
+observation_store = ObservationStore(OBSERVATION_DB, OBSERVATION_BATCH)
+
+
+# Compiled gauge catalog, cached on disk and rebuilt only when a source file changes
+CATALOG_CACHE = os.getenv("CATALOG_CACHE", "cache/catalog.pickle")
+CATALOG_VERSION = 4
+RiverCatalog = namedtuple('RiverCatalog', ['river', 'source', 'fieldnames', 'rows', 'thresholds', 'schema'])
+
+# Common gauge schema: field -> source column names it is read from. Column names
+# match case-insensitively, ignoring spaces and underscores. Cells stay as text in
+# the catalog; mile markers are parsed by _table_columns and thresholds by
+# _compile_thresholds. Any other column is passed through to the report unchanged.
+GAUGE_SCHEMA = {
+    'section': ('Zone', 'Reach', 'Pool', 'Section'),
+    'gauge': ('Gauge',),
+    'url': ('URL',),
+    'mile_markers': ('Mile Markers',),
+    'low_action': ('Low Action',),
+    'low_watch': ('Low Watch',),
+    'normal': ('Normal',),
+    'high_watch': ('High Watch', 'Watch'),
+    'high_action': ('High Action', 'Action'),
+    'flow_limit': ('Lock Closure', 'Flow Limit'),
+}
+REQUIRED_FIELDS = ('gauge', 'url')
+REPORT_COLUMNS = ('Current', 'Category')  # Filled in by the report, never read from a source
+
+
+def _column_key(name):
+    return re.sub(r'[\s_]', '', name).lower()
+
+
+_SCHEMA_COLUMNS = {_column_key(alias): field for field, aliases in GAUGE_SCHEMA.items()
+                   for alias in aliases + (field,)}
+_catalogs = {}  # Compiled catalogs by source directory
+_catalog_lock = threading.Lock()
+
+
+def _catalog_sources(path):
+    """Return the source files that make up the catalog in path, in a stable order."""
+    try:
+        files = sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith('_src.csv'))
+    except OSError:
+        return []
+    json_file = os.path.join(path, 'bak', 'data.json')
+    if os.path.exists(json_file):
+        files.append(json_file)
+    return files
+
+
+def _file_signature(file, known=None):
+    """
+    Return (mtime_ns, size, sha1) for file.
+
+    The content hash is only recomputed when the modification time or size differs
+    from `known`, so an unchanged file costs one stat call.
+    """
+    stat = os.stat(file)
+    if known is not None and tuple(known[:2]) == (stat.st_mtime_ns, stat.st_size):
+        return tuple(known)
+    with open(file, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    return (stat.st_mtime_ns, stat.st_size, digest)
+
+
+def _json_cell(value):
+    """Format a data.json value the way the source CSVs spell it."""
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return '[' + ', '.join(str(v) for v in value) + ']'
+    return str(value)
+
+
+def catalog_schema(fieldnames):
+    """
+    Map a source file's columns onto GAUGE_SCHEMA.
+
+    Args:
+        fieldnames (list): Column names as spelled in the source file.
+
+    Returns:
+        tuple: (schema, missing) where schema maps each recognized field to its
+            source column and missing lists the REQUIRED_FIELDS the file lacks.
+    """
+    schema = {}
+    for name in fieldnames:
+        field = _SCHEMA_COLUMNS.get(_column_key(name))
+        if field and field not in schema:
+            schema[field] = name
+    missing = [field for field in REQUIRED_FIELDS if field not in schema]
+    return schema, missing
+
+
+def _compile_river(river, file, fieldnames, rows):
+    """Return the catalog entry for one river, with its schema and compiled thresholds."""
+    schema, _ = catalog_schema(fieldnames)
+    return file, tuple(fieldnames), rows, _compile_thresholds(river, schema, fieldnames, rows), schema
+
+
+def _compile_catalog(files):
+    """
+    Parse every source file into plain tuples ready to be pickled.
+
+    Source CSVs win over data.json; rivers that only appear in data.json are
+    included from there. Every river is mapped onto GAUGE_SCHEMA by
+    catalog_schema, so a new river only needs a source file; rivers whose file
+    lacks a gauge name or URL column are recorded in 'errors' instead. Each
+    river's threshold columns are compiled into an interval table by
+    _compile_thresholds.
+    """
+    rivers = {}
+    errors = {}
+    for file in files:
+        if not file.endswith('_src.csv'):
+            continue
+        river = os.path.basename(file)[:-len('_src.csv')]
+        try:
+            with open(file, newline='') as csv_file:
+                reader = csv.reader(csv_file)
+                fieldnames = next(reader, None)
+                missing = catalog_schema(fieldnames)[1] if fieldnames else REQUIRED_FIELDS
+                if missing:
+                    errors[river] = f"Invalid or missing headers in {file}: no {', '.join(missing)} column"
+                    continue
+                width = len(fieldnames)
+                rows = [tuple(row[:width]) + (None,) * (width - len(row)) for row in reader if row]
+        except (OSError, csv.Error) as e:
+            errors[river] = f"Error processing CSV file: {e}"
+            continue
+        rivers[river] = _compile_river(river, file, fieldnames, rows)
+
+    for file in files:
+        if not file.endswith('.json'):
+            continue
+        try:
+            with open(file) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping {file}: {e}")
+            continue
+        for name, records in (data.get('river') or {}).items():
+            river = name.lower()
+            if river in rivers or river in errors or not records:
+                continue
+            fieldnames = []
+            for record in records:
+                fieldnames.extend(k for k in record if k not in fieldnames)
+            if catalog_schema(fieldnames)[1]:
+                continue
+            rows = [tuple(_json_cell(record.get(k)) for k in fieldnames) for record in records]
+            rivers[river] = _compile_river(river, file, fieldnames, rows)
+    return {'rivers': rivers, 'errors': errors}
+
+
+def _read_catalog_cache(path):
+    """Return the pickled catalog for path, or None if it is missing, stale-format or unreadable."""
+    try:
+        with open(CATALOG_CACHE, 'rb') as f:
+            cached = pickle.load(f)
+    except (OSError, pickle.PickleError, EOFError, AttributeError, ValueError):
+        return None
+    if not isinstance(cached, dict) or cached.get('version') != CATALOG_VERSION or cached.get('path') != path:
+        return None
+    return cached
+
+
+def load_catalog(path):
+    """
+    Return the compiled gauge catalog for the source directory.
+
+    Every '*_src.csv' (plus 'bak/data.json') is parsed once into plain tuples and
+    pickled to CATALOG_CACHE. Later calls, in this process or the next, reuse the
+    compiled form as long as each source file's mtime and size are unchanged, or
+    its content hash still matches after a touch.
+
+    Args:
+        path (str): Directory path to the input CSV files (e.g., 'program/app/src/').
+
+    Returns:
+        dict: 'rivers' maps river -> RiverCatalog; 'errors' maps river -> error message.
+    """
+    with _catalog_lock:
+        files = _catalog_sources(path)
+        cached = _catalogs.get(path) or _read_catalog_cache(path)
+        known = cached['sources'] if cached else {}
+        try:
+            sources = {file: _file_signature(file, known.get(file)) for file in files}
+        except OSError as e:
+            logger.error(f"Failed to read gauge catalog sources in {path}: {e}")
+            sources = {}
+
+        if cached and {f: sig[2] for f, sig in sources.items()} == {f: sig[2] for f, sig in known.items()}:
+            compiled = cached
+            if sources != known:  # Touched but unchanged; remember the new mtimes
+                compiled = dict(cached, sources=sources)
+                _save_catalog(compiled)
+        else:
+            compiled = dict(_compile_catalog(files), version=CATALOG_VERSION, path=path, sources=sources)
+            _save_catalog(compiled)
+            logger.info(f"Compiled gauge catalog for {path}: {len(compiled['rivers'])} rivers")
+        _catalogs[path] = compiled
+
+    return {
+        'rivers': {river: RiverCatalog(river, *entry) for river, entry in compiled['rivers'].items()},
+        'errors': compiled['errors'],
+    }
+
+
+def _save_catalog(compiled):
+    """Pickle the compiled catalog to CATALOG_CACHE; failures only cost a rebuild next run."""
+    try:
+        directory = os.path.dirname(CATALOG_CACHE)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _write_atomic(CATALOG_CACHE, pickle.dumps(compiled, protocol=pickle.HIGHEST_PROTOCOL))
+    except OSError as e:
+        logger.warning(f"Failed to cache gauge catalog: {e}")
+
+
+# Stage categories, checked in this order; the first matching rule wins
+CATEGORIES = ('High Action', 'High Watch', 'Low Action', 'Low Watch')
+THRESHOLD_ROLES = ('low_action', 'low_watch', 'normal', 'high_watch', 'high_action')
+_NUMBER = r'-?(?:\d+(?:\.\d*)?|\.\d+)'
+THRESHOLD_INTERVAL = re.compile(rf'^\[\s*({_NUMBER})\s*,\s*({_NUMBER})\s*\]$')  # "[14.2, 15.2]"
+THRESHOLD_RANGE = re.compile(rf'^({_NUMBER})\s*-\s*({_NUMBER})$')  # "26 - 29.99"
+THRESHOLD_VALUE = re.compile(rf'^({_NUMBER})\s*(KCFS)?$', re.IGNORECASE)  # "22.0", "116KCFS", "125 KCFS"
+
+
+def parse_threshold(cell):
+    """
+    Parse one threshold cell from a source catalog.
+
+    Args:
+        cell (str): "[a, b]" interval, "a - b" range, bare number or "<n> KCFS" flow.
+
+    Returns:
+        tuple: (low, high, unit) with unit 'ft' for stage or 'kcfs' for flow; a bare
+            number has low == high. None for an empty cell.
+
+    Raises:
+        ValueError: If the cell is not in a recognized format.
+    """
+    cell = (cell or '').strip()
+    if not cell:
+        return None
+    match = THRESHOLD_INTERVAL.match(cell) or THRESHOLD_RANGE.match(cell)
+    if match:
+        return float(match.group(1)), float(match.group(2)), 'ft'
+    match = THRESHOLD_VALUE.match(cell)
+    if match:
+        value = float(match.group(1))
+        return value, value, 'kcfs' if match.group(2) else 'ft'
+    raise ValueError(f"Unrecognized threshold {cell!r}")
+
+
+def _compile_thresholds(river, schema, fieldnames, rows):
+    """
+    Parse a river's threshold columns into a plain interval table for the catalog cache.
+
+    Returns:
+        dict: Each role in THRESHOLD_ROLES -> (lows, highs) tuples with one float per
+            row (NaN where the row has no threshold), and 'flow' -> flow limits in
+            KCFS per row (from any threshold column given in KCFS, usually
+            'flow_limit'). Flow limits are kept for reference but not classified.
+    """
+    nan = float('nan')
+    columns = [(fieldnames.index(name), field) for field, name in schema.items()
+               if field in THRESHOLD_ROLES or field == 'flow_limit']
+    table = {role: ([nan] * len(rows), [nan] * len(rows)) for role in THRESHOLD_ROLES}
+    flow = [nan] * len(rows)
+    invalid = 0
+    for position, row in enumerate(rows):
+        for index, role in columns:
+            try:
+                threshold = parse_threshold(row[index])
+            except ValueError:
+                invalid += 1
+                continue
+            if threshold is None:
+                continue
+            low, high, unit = threshold
+            if unit == 'kcfs':
+                flow[position] = high
+            elif role != 'flow_limit':
+                table[role][0][position] = low
+                table[role][1][position] = high
+    if invalid:
+        logger.warning(f"{river.upper()}: {invalid} threshold cells could not be parsed")
+    compiled = {role: (tuple(lows), tuple(highs)) for role, (lows, highs) in table.items()}
+    compiled['flow'] = tuple(flow)
+    return compiled
+
+
+class ThresholdTable:
+    """
+    A river's compiled thresholds as numpy arrays, for classifying stages a whole slice at a time.
+
+    classify() compares a vector of stages (or a 2-D array of stage histories, one
+    column per catalog row) against every row's thresholds at once:
+    High Action if v >= the High Action threshold, High Watch if v >= the low end
+    of the High Watch interval, Low Action if v <= the Low Action threshold, Low
+    Watch if v <= the high end of the Low Watch interval, and Normal otherwise.
+    Rows without any stage threshold are "Unclassified" and missing stages are
+    "No Data".
+    """
+
+    def __init__(self, thresholds):
+        self.low_action = numpy.array(thresholds['low_action'][1])
+        self.low_watch = numpy.array(thresholds['low_watch'][1])
+        self.high_watch = numpy.array(thresholds['high_watch'][0])
+        self.high_action = numpy.array(thresholds['high_action'][0])
+        self.flow = numpy.array(thresholds['flow'])
+        bounds = numpy.array([bound for role in THRESHOLD_ROLES for bound in thresholds[role]])
+        self.unclassified = numpy.isnan(bounds).all(axis=0) if bounds.size else numpy.ones(0, dtype=bool)
+
+    def classify(self, values, start=0, stop=None):
+        """
+        Classify stages for the catalog rows start..stop.
+
+        Args:
+            values: Stages for those rows (numbers, or anything else for no reading),
+                as a sequence or an array whose last axis is the rows.
+            start (int): First catalog row.
+            stop (int): End of the row slice (default the last row).
+
+        Returns:
+            numpy.ndarray: Category names, the same shape as values.
+        """
+        rows = slice(start, stop)
+        if isinstance(values, numpy.ndarray) and values.dtype.kind == 'f':
+            stages = values
+        else:
+            stages = numpy.array([_stage(value) for value in numpy.ravel(numpy.asarray(values, dtype=object))],
+                                 dtype=float).reshape(numpy.shape(values))
+        categories = numpy.select(
+            [stages >= self.high_action[rows], stages >= self.high_watch[rows],
+             stages <= self.low_action[rows], stages <= self.low_watch[rows]],
+            CATEGORIES, default='Normal').astype(object)
+        categories[numpy.broadcast_to(self.unclassified[rows], stages.shape)] = 'Unclassified'
+        categories[numpy.isnan(stages)] = 'No Data'
+        return categories
+
+    def take(self, indices):
+        """Return the thresholds of the rows selected by an index array or boolean mask."""
+        table = ThresholdTable.__new__(ThresholdTable)
+        for name, array in vars(self).items():
+            setattr(table, name, array[indices])
+        return table
+
+
+def _stage(value):
+    """Return value as a float stage, or NaN if it is not a reading."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
+
+
+class ReportTable:
+    """
+    Columnar form of one river's report.
+
+    Catalog text columns are numpy object arrays of interned strings, built once
+    per compiled catalog and shared by every table made from it; column() reads
+    them by source column name or by GAUGE_SCHEMA field. The numeric
+    columns are float arrays: `current` (stage, NaN when there is no reading),
+    `mile_start` and `mile_end` (from a "Mile Markers" interval) and the river's
+    ThresholdTable. `notes` holds the text written in place of a missing reading
+    ("No Data", TIMED_OUT, CIRCUIT_OPEN) and `category` the stage classification.
+    Sort or filter with a numpy index array or mask through take(), e.g.
+    ``table.take(numpy.argsort(table.mile_start))``.
+    """
+
+    def __init__(self, river, fieldnames, schema, columns, gauges, mile_start, mile_end, thresholds):
+        self.river = river
+        self.schema = schema
+        self.fieldnames = list(fieldnames)
+        for column in REPORT_COLUMNS:
+            if column not in self.fieldnames:
+                self.fieldnames.append(column)
+        self.columns = columns
+        self.gauges = gauges
+        self.mile_start = mile_start
+        self.mile_end = mile_end
+        self.thresholds = thresholds
+        self.current = numpy.full(len(gauges), numpy.nan)
+        self.notes = numpy.full(len(gauges), None, dtype=object)
+        self.category = numpy.full(len(gauges), '', dtype=object)
+
+    @classmethod
+    def from_catalog(cls, river_catalog):
+        """Build an empty report table for a compiled catalog entry."""
+        key = (river_catalog.source, river_catalog.river)
+        cached = _report_columns.get(key)
+        if cached is None or cached[0] is not river_catalog.rows:
+            columns = _table_columns(river_catalog.schema, river_catalog.fieldnames, river_catalog.rows)
+            cached = (river_catalog.rows, columns, ThresholdTable(river_catalog.thresholds))
+            _report_columns[key] = cached
+        _, (columns, gauges, mile_start, mile_end), thresholds = cached
+        return cls(river_catalog.river, river_catalog.fieldnames, river_catalog.schema,
+                   columns, gauges, mile_start, mile_end, thresholds)
+
+    @classmethod
+    def from_rows(cls, river, fieldnames, rows):
+        """Build a report table from row dicts whose 'Current' values are already filled in."""
+        fieldnames = list(fieldnames)
+        schema, missing = catalog_schema(fieldnames)
+        if missing:
+            raise ValueError(f"Report rows have no {', '.join(missing)} column")
+        cells = [tuple(row.get(name) for name in fieldnames) for row in rows]
+        columns, gauges, mile_start, mile_end = _table_columns(schema, fieldnames, cells)
+        table = cls(river, fieldnames, schema, columns, gauges, mile_start, mile_end,
+                    ThresholdTable(_compile_thresholds(river, schema, fieldnames, cells)))
+        for index, row in enumerate(rows):
+            value = row.get('Current')
+            table.current[index] = _stage(value)
+            if numpy.isnan(table.current[index]):
+                table.notes[index] = value if value is not None else "No Data"
+        return table
+
+    def __len__(self):
+        return len(self.gauges)
+
+    def column(self, name):
+        """Return a catalog text column by source column name or GAUGE_SCHEMA field."""
+        return self.columns[self.schema.get(name, name)]
+
+    def fill(self, index, level):
+        """
+        Record a row's water level.
+
+        Args:
+            index (int): Row index.
+            level: Water level (None when the fetch failed, TIMED_OUT when it did not
+                finish before the run deadline, CIRCUIT_OPEN when the gauge was skipped
+                by its circuit breaker). Ignored for rows without a URL.
+
+        Returns:
+            str: 'ok', 'no_data', 'timed_out', 'circuit_open' or 'no_url'.
+        """
+        if self.gauges[index] is None:
+            logger.warning(f"No URL provided for {self.column('gauge')[index]}")
+            self.notes[index] = "No Data"
+            return 'no_url'
+        if level is TIMED_OUT or level is CIRCUIT_OPEN:
+            self.notes[index] = level
+            return 'timed_out' if level is TIMED_OUT else 'circuit_open'
+        if level is None:
+            logger.warning(f"Could not retrieve data for {self.column('gauge')[index]} {self.column('url')[index]}")
+            self.notes[index] = "No Data"
+            return 'no_data'
+        self.current[index] = level
+        return 'ok'
+
+    def classify(self, start=0, stop=None):
+        """Classify the current levels of rows start..stop into the 'category' column."""
+        self.category[start:stop] = self.thresholds.classify(self.current[start:stop], start, stop)
+
+    def take(self, indices):
+        """Return a new table holding the rows selected by an index array or boolean mask."""
+        table = ReportTable(self.river, self.fieldnames, self.schema,
+                            {name: column[indices] for name, column in self.columns.items()},
+                            self.gauges[indices], self.mile_start[indices], self.mile_end[indices],
+                            self.thresholds.take(indices))
+        table.current = self.current[indices]
+        table.notes = self.notes[indices]
+        table.category = self.category[indices]
+        return table
+
+    def records(self, start=0, stop=None):
+        """Return the rows start..stop as lists of cells in `fieldnames` order."""
+        rows = slice(start, stop)
+        current = [value if note is None else note
+                   for value, note in zip(self.current[rows].tolist(), self.notes[rows])]
+        cells = []
+        for name in self.fieldnames:
+            if name == 'Current':
+                cells.append(current)
+            elif name == 'Category':
+                cells.append(self.category[rows])
+            else:
+                cells.append(self.columns[name][rows])
+        return [list(row) for row in zip(*cells)]
+
+
+_report_columns = {}  # (source, river) -> (catalog rows, table columns, ThresholdTable)
+
+
+def _table_columns(schema, fieldnames, rows):
+    """
+    Split catalog rows into interned text columns plus gauge IDs and mile marker arrays.
+
+    Returns:
+        tuple: (columns, gauges, mile_start, mile_end).
+    """
+    columns = {}
+    for index, name in enumerate(fieldnames):
+        if name in REPORT_COLUMNS:
+            continue
+        columns[name] = numpy.array([sys.intern(row[index] or '') for row in rows], dtype=object)
+    gauges = numpy.array([gauge_id(url) if url else None for url in columns[schema['url']]], dtype=object)
+    mile_start = numpy.full(len(rows), numpy.nan)
+    mile_end = numpy.full(len(rows), numpy.nan)
+    for index, cell in enumerate(columns.get(schema.get('mile_markers'), ())):
+        try:
+            markers = parse_threshold(cell)
+        except ValueError:
+            continue
+        if markers:
+            mile_start[index], mile_end[index], _ = markers
+    return columns, gauges, mile_start, mile_end
+
+
+def discover_rivers(path):
+    """
+    List the rivers that have a source in the catalog directory.
+
+    A river is any '<river>_src.csv' in path or any river in 'bak/data.json',
+    including rivers whose source is invalid, so their errors are reported.
+
+    Args:
+        path (str): Directory path to the input CSV files (e.g., 'program/app/src/').
+
+    Returns:
+        list: River codes in alphabetical order.
+    """
+    catalog = load_catalog(path)
+    return sorted(set(catalog['rivers']) | set(catalog['errors']))
+
+
+def load_river(path, river_name):
+    """
+    Read a river from the compiled gauge catalog into a fresh ReportTable.
+
+    Args:
+        path (str): Directory path to the input CSV files (e.g., 'program/app/src/').
+        river_name (str): Name of the river (e.g., 'ilr', 'umr', 'mor').
+
+    Returns:
+        tuple: (RiverCatalog, ReportTable), or None if the river is missing or invalid.
+    """
+    if not path or not river_name:
+        logger.error("Path or river_name cannot be empty")
+        return None
+
+    catalog = load_catalog(path)
+    if river_name in catalog['errors']:
+        logger.error(catalog['errors'][river_name])
+        return None
+    river = catalog['rivers'].get(river_name)
+    if river is None:
+        logger.error(f"Input CSV file {path + river_name + '_src.csv'} not found")
+        return None
+    return river, ReportTable.from_catalog(river)
+
+
+# Streaming report output
+REPORT_DIR = 'reports/csv'  # Published reports, one current CSV per river
+REPORT_ARCHIVE_DIR = f'{REPORT_DIR}/archive'  # Reports replaced by a newer one
+REPORT_MANIFEST = f'{REPORT_DIR}/latest.json'  # River -> current report file, rows and publish time
+REPORT_ARCHIVE = os.getenv("REPORT_ARCHIVE", "1") == "1"  # Keep replaced reports; 0 deletes them (history stays in OBSERVATION_DB)
+ARCHIVE_INDEX = f'{REPORT_ARCHIVE_DIR}/index.csv'  # Append-only log of every archived report
+ARCHIVE_INDEX_FIELDS = ['river', 'timestamp', 'path', 'rows', 'sha256']
+REPORT_WINDOW = int(os.getenv("REPORT_WINDOW", 256))  # Max gauges fetched ahead of the oldest unfinished one
+
+
+def _remove_stale_temps(directory, river_name):
+    """
+    Delete a river's unfinished report temp files that nothing has written to for 2 * RUN_DEADLINE seconds.
+
+    A live writer touches its temp file throughout its run, so only files left by a
+    crashed or killed process are old enough to go.
+    """
+    cutoff = time.time() - 2 * RUN_DEADLINE
+    for file in os.listdir(directory):
+        if file.startswith(f'.{river_name}_') and file.endswith('.csv.tmp'):
+            path = f'{directory}/{file}'
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    logger.info(f"Removed unfinished {river_name.upper()} report {path} left by an earlier run")
+            except OSError:
+                pass  # Already gone
+
+
+class ReportWriter:
+    """
+    Streams one river's report to disk in source order while its gauges are still being fetched.
+
+    feed() fills and writes rows from the front of the river's ReportTable as soon
+    as their gauge values are known, and stops at the first row whose gauge is
+    still in flight. Values that arrive early wait in the `levels` dict passed to
+    feed, which acts as the reorder buffer; with the fetch engines held to
+    REPORT_WINDOW gauges ahead of the oldest unfinished one, at most that many
+    rows are ever waiting. Each run of ready rows is classified with one vectorized
+    ReportTable.classify call. Rows go to a hidden temp file in reports/csv/ that
+    commit() renames into place atomically, so readers never see a partial CSV and
+    a failed run leaves the previous report untouched. Temp files left behind by a
+    process that crashed are removed when the river's next writer opens.
+    """
+
+    def __init__(self, river_name, table, directory=REPORT_DIR):
+        self.river_name = river_name
+        self.table = table
+        self.cursor = 0
+        self.rows_written = 0
+        self.outcomes = {}
+        self.classify_time = 0.0
+        self.write_time = 0.0
+        self.failed = False
+        self.committed = False
+        os.makedirs(directory, exist_ok=True)
+        _remove_stale_temps(directory, river_name)
+        name = f'{river_name}_{datetime.now().strftime("%Y-%m-%d_%Hh%Mm%Ss")}.csv'
+        self.path = f'{directory}/{name}'
+        self.temp_path = f'{directory}/.{name}.tmp'
+        self.file = open(self.temp_path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(table.fieldnames)
+
+    def write(self, start=0, stop=None):
+        """Append the table rows start..stop to the temp file."""
+        stop = len(self.table) if stop is None else stop
+        if self.failed:
+            return
+        started = time.perf_counter()
+        try:
+            self.writer.writerows(self.table.records(start, stop))
+        except (OSError, ValueError) as e:
+            self.failed = True
+            logger.error(f"Failed to write CSV for {self.river_name.upper()}: {e}")
+        self.rows_written += stop - start
+        self.write_time += time.perf_counter() - started
+
+    def feed(self, levels):
+        """
+        Fill and write every row from the cursor on whose gauge value is in levels.
+
+        Args:
+            levels (dict): Water levels fetched so far, keyed by gauge ID.
+
+        Returns:
+            bool: True once every row has been written.
+        """
+        table = self.table
+        start = stop = self.cursor
+        while stop < len(table) and (table.gauges[stop] is None or table.gauges[stop] in levels):
+            stop += 1
+        if stop > start:
+            started = time.perf_counter()
+            for index in range(start, stop):
+                gauge = table.gauges[index]
+                outcome = table.fill(index, levels[gauge] if gauge else None)
+                self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            table.classify(start, stop)
+            self.classify_time += time.perf_counter() - started
+            self.write(start, stop)
+            self.cursor = stop
+        return stop == len(table)
+
+    def commit(self):
+        """
+        Close the finished temp file and publish it with publish_report.
+
+        Returns:
+            str: Path of the published CSV, or None if nothing was published.
+        """
+        if self.rows_written == 0:
+            logger.error(f"No data processed for {self.river_name} report")
+            self.abort()
+            return None
+        if self.failed:
+            self.abort()
+            return None
+        started = time.perf_counter()
+        try:
+            self.file.close()
+            self.write_time += time.perf_counter() - started
+            publish_report(self.river_name, self.temp_path, self.path, self.rows_written)
+        except OSError as e:
+            logger.error(f"Failed to write CSV for {self.river_name.upper()}: {e}")
+            self.abort()
+            return None
+        self.committed = True
+        run_metrics.add_stage('classify', self.classify_time)
+        run_metrics.add_stage('write', self.write_time)
+        if self.outcomes:
+            self._log_summary()
+        logger.info(f"Success - {self.river_name.upper()} CSV written to {self.path}")
+        return self.path
+
+    def abort(self):
+        """Discard the temp file unless the report was committed."""
+        if self.committed:
+            return
+        self.file.close()
+        try:
+            os.remove(self.temp_path)
+        except FileNotFoundError:
+            pass
+
+    def _log_summary(self):
+        river = self.river_name.upper()
+        outcomes = self.outcomes
+        logger.info(f"{river}: {self.cursor - outcomes.get('no_url', 0)} URL hits")
+        statuses = [cache_status.get(gauge) for gauge in set(self.table.gauges) if gauge]
+        logger.info(f"{river}: HTTP cache {statuses.count('hit')} hits, "
+                    f"{statuses.count('revalidated')} revalidated, {statuses.count('miss')} misses")
+        if outcomes.get('no_url'):
+            logger.warning(f"Found {outcomes['no_url']} rows with empty URLs in {self.river_name} report")
+        if outcomes.get('timed_out'):
+            logger.warning(f"{river}: {outcomes['timed_out']} rows timed out before the run deadline")
+        if outcomes.get('circuit_open'):
+            logger.warning(f"{river}: {outcomes['circuit_open']} rows skipped, gauge circuit open")
+
+
+def generate_reports(path, river_name, deadline=None):
+    """
+    Generate a water level report for a specified river and save it as a CSV file.
+
+    Reads a CSV file containing gauge URLs for the given river, fetches current water
+    levels using get_water_level, and streams the results through a ReportWriter to a
+    timestamped CSV file in the reports/ directory, each row written as soon as its
+    gauge has been fetched. Caches water levels to avoid redundant requests for
+    duplicate gauges within the same river. Logs the process and any errors encountered.
+    Once the run deadline expires the remaining gauges are marked as timed out and
+    the report is written with the values fetched so far.
+
+    Args:
+        path (str): Directory path to the input CSV files (e.g., 'program/app/src/').
+        river_name (str): Name of the river (e.g., 'ilr', 'umr', 'mor').
+        deadline (Deadline): Run-wide time budget (default RUN_DEADLINE seconds from now).
+
+    Returns:
+        None: The function writes output to a CSV file and logs results.
+    """
+    with run_metrics.stage('load'):
+        loaded = load_river(path, river_name)
+        if loaded is not None and REPLAY_MODE != 'replay':
+            observation_store.preload(gauge for gauge in loaded[1].gauges if gauge is not None)
+    if loaded is None:
+        return
+    _, table = loaded
+
+    levels = {}  # Cache water levels by gauge ID within this river
+    deadline = deadline or Deadline(RUN_DEADLINE)
+    logger.info(f"Starting CSV writing process for {river_name.upper()}")
+    try:
+        writer = ReportWriter(river_name, table)
+    except OSError as e:
+        logger.error(f"Failed to write CSV for {river_name.upper()}: {e}")
+        return
+    try:
+        with run_metrics.stage('fetch'):
+            for url, gauge in zip(table.column('url'), table.gauges):
+                if gauge is not None and gauge not in levels:
+                    levels[gauge] = fetch_gauge(url, deadline)
+                writer.feed(levels)
+        writer.commit()
+    finally:
+        writer.abort()
+
+
+class FetchWindow:
+    """
+    Tracks which URLs a fetch engine may start, holding them to `size` places ahead of the oldest unfinished one.
+
+    Only the URLs finished ahead of the oldest unfinished one are remembered, so
+    the bookkeeping stays proportional to the window rather than to the URL list.
+    """
+
+    def __init__(self, total, size=None):
+        self.total = total
+        self.size = size or total
+        self.next_index = 0  # First URL not started yet
+        self.oldest = 0  # First URL that has not finished
+        self.finished = set()  # Finished URLs past the oldest unfinished one
+
+    def starts(self):
+        """Yield the index of every URL that may be started now."""
+        while self.next_index < self.total and self.next_index < self.oldest + self.size:
+            self.next_index += 1
+            yield self.next_index - 1
+
+    def finish(self, index):
+        """Mark a URL finished, sliding the window past every finished URL at its front."""
+        self.finished.add(index)
+        while self.oldest in self.finished:
+            self.finished.discard(self.oldest)
+            self.oldest += 1
+
+    def complete(self):
+        """Return True once every URL has finished."""
+        return self.oldest >= self.total
+
+    def unfinished(self):
+        """Return the indices of the URLs that have not finished, in order."""
+        return [index for index in range(self.oldest, self.total) if index not in self.finished]
+
+
+async def _fetch_levels_async(urls, concurrency, timeout, deadline, on_result=None, window=None):
+    """
+    Fetch every URL concurrently with at most `concurrency` requests in flight.
+
+    Each blocking get_water_level call runs on a worker thread sharing the pooled
+    session; a request that exceeds `timeout` seconds, or the run deadline, is
+    reported as TIMED_OUT. A URL is only started once every URL more than `window`
+    places before it has finished, and on_result(index, level) is called on the
+    event loop thread as each one completes. With on_result given no result list
+    is kept, so memory stays proportional to the window rather than to `urls`.
+
+    Returns:
+        list: Water levels in the same order as `urls`, or None when on_result is given.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='fetch')
+
+    async def fetch(index, url):
+        async with semaphore:
+            if deadline.expired():
+                return index, TIMED_OUT
+            limit = min(timeout, deadline.remaining())
+            try:
+                return index, await asyncio.wait_for(
+                    loop.run_in_executor(executor, fetch_gauge, url, deadline), limit)
+            except asyncio.TimeoutError:
+                logger.error(f"Timed out after {limit:.1f}s fetching {url}")
+                return index, TIMED_OUT
+
+    results = None if on_result is not None else [TIMED_OUT] * len(urls)
+    tracker = FetchWindow(len(urls), window)
+    pending = set()
+    try:
+        while not tracker.complete():
+            for index in tracker.starts():
+                pending.add(asyncio.ensure_future(fetch(index, urls[index])))
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index, level = task.result()
+                tracker.finish(index)
+                if results is not None:
+                    results[index] = level
+                else:
+                    on_result(index, level)
+        return results
+    finally:
+        if deadline.expired():
+            deadline.cancel()  # Stop requests still running on the executor
+        # Don't wait on requests abandoned by a timeout
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def fetch_levels(urls, concurrency=None, timeout=None, deadline=None, on_result=None, window=None):
+    """
+    Fetch water levels for many URLs at once using the asyncio fetch engine.
+
+    Args:
+        urls (list): URLs to fetch.
+        concurrency (int): Global cap on in-flight requests (default FETCH_CONCURRENCY).
+        timeout (float): Per-request timeout in seconds (default FETCH_TIMEOUT).
+        deadline (Deadline): Run-wide time budget (default RUN_DEADLINE seconds from now).
+        on_result (callable): Called as on_result(index, level) as each URL completes.
+        window (int): Max URLs started ahead of the oldest unfinished one (default no limit).
+
+    Returns:
+        list: Water levels (None on failure, TIMED_OUT past a timeout) in the same order as `urls`,
+            or None when on_result is given.
+    """
+    if not urls:
+        return None if on_result is not None else []
+    concurrency = concurrency or FETCH_CONCURRENCY
+    timeout = timeout or FETCH_TIMEOUT
+    deadline = deadline or Deadline(RUN_DEADLINE)
+    return asyncio.run(_fetch_levels_async(urls, concurrency, timeout, deadline, on_result, window))
+
+
+# Shared worker pool for the 'pool' fetch engine, created on first use
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", 16))
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+
+
+def get_worker_pool():
+    """Return the shared per-gauge worker pool, creating it with FETCH_WORKERS threads on first use."""
+    global _worker_pool
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            _worker_pool = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix='gauge')
+        return _worker_pool
+
+
+def shutdown_worker_pool():
+    """Stop the shared worker pool and hedge threads, dropping any gauge tasks that have not started."""
+    global _worker_pool
+    with _worker_pool_lock:
+        if _worker_pool is not None:
+            _worker_pool.shutdown(wait=False, cancel_futures=True)
+            _worker_pool = None
+    hedger.shutdown()
+
+
+def fetch_levels_pooled(urls, deadline=None, on_result=None, window=None):
+    """
+    Fetch water levels for many URLs as individual tasks on the shared worker pool.
+
+    Every gauge of every river is queued on one pool, so an idle worker picks up
+    the next gauge whichever river it belongs to, and a large river no longer
+    bounds the run. Logs pool utilization and the deepest task backlog seen.
+    Gauges still queued or running when the deadline expires are cancelled and
+    reported as TIMED_OUT.
+
+    Args:
+        urls (list): URLs to fetch.
+        deadline (Deadline): Run-wide time budget (default RUN_DEADLINE seconds from now).
+        on_result (callable): Called as on_result(index, level) on this thread as each URL completes.
+        window (int): Max URLs queued ahead of the oldest unfinished one (default no limit).
+
+    Returns:
+        list: Water levels (None on failure, TIMED_OUT past the deadline) in the same order as `urls`,
+            or None when on_result is given; then only the window's results are held in memory.
+    """
+    if not urls:
+        return None if on_result is not None else []
+    deadline = deadline or Deadline(RUN_DEADLINE)
+    lock = threading.Lock()
+    counters = {'started': 0, 'busy': 0.0}
+
+    def task(url):
+        with lock:
+            counters['started'] += 1
+        started = time.perf_counter()
+        try:
+            return fetch_gauge(url, deadline)
+        finally:
+            with lock:
+                counters['busy'] += time.perf_counter() - started
+
+    start = time.perf_counter()
+    pool = get_worker_pool()
+    results = None if on_result is not None else [TIMED_OUT] * len(urls)
+    tracker = FetchWindow(len(urls), window)
+    pending = {}  # Future -> URL index
+    max_depth = 0
+    while not tracker.complete():
+        for index in tracker.starts():
+            pending[pool.submit(task, urls[index])] = index
+        done, _ = wait(pending, timeout=deadline.remaining(), return_when=FIRST_COMPLETED)
+        with lock:
+            max_depth = max(max_depth, tracker.next_index - counters['started'])
+        if not done:
+            deadline.cancel()  # Stop in-flight requests; queued tasks return TIMED_OUT
+            for future in pending:
+                future.cancel()
+            logger.error(f"Run deadline reached with {len(tracker.unfinished())} gauges outstanding")
+            break
+        for future in done:
+            index = pending.pop(future)
+            tracker.finish(index)
+            if results is not None:
+                results[index] = future.result()
+            else:
+                on_result(index, future.result())
+    wall = time.perf_counter() - start
+
+    if on_result is not None:
+        for index in tracker.unfinished():
+            on_result(index, TIMED_OUT)
+    utilization = counters['busy'] / (FETCH_WORKERS * wall) if wall else 0.0
+    logger.info(f"Worker pool: {len(urls)} gauges on {FETCH_WORKERS} workers in {wall:.2f}s, "
+                f"utilization {utilization:.0%}, max queue depth {max_depth}")
+    return results
+
+
+def gauge_id(url):
+    """
+    Return the NOAA gauge ID from a gauge page URL.
+
+    Args:
+        url (str): Gauge URL (e.g., 'https://water.noaa.gov/gauges/omhn1').
+
+    Returns:
+        str: Lower-case gauge ID (e.g., 'omhn1').
+    """
+    return url.rstrip('/').rsplit('/', 1)[-1].lower()
+
+
+def plan_fetches(path, rivers=None):
+    """
+    Read every river's source CSV and build the unique set of gauges to fetch.
+
+    The same gauge can appear several times in one river and under several rivers;
+    planning across all of them up front means each gauge is requested exactly once.
+
+    Args:
+        path (str): Directory path to the input CSV files (e.g., 'program/app/src/').
+        rivers (list): River codes to plan for. Defaults to every river in the catalog.
+
+    Returns:
+        tuple: (loaded, plan) where loaded maps river -> (RiverCatalog, ReportTable) and
+            plan maps gauge ID -> URL in first-seen order.
+    """
+    if rivers is None:
+        rivers = discover_rivers(path)
+
+    loaded = {}
+    plan = {}
+    gauge_rows = 0
+    for river in rivers:
+        logger.info(f"-------Obtaining {river.upper()} river data-------")
+        result = load_river(path, river)
+        if result is None:
+            continue
+        loaded[river] = result
+        table = result[1]
+        for url, gauge in zip(table.column('url'), table.gauges):
+            if gauge is not None:
+                gauge_rows += 1
+                plan.setdefault(gauge, url)
+
+    logger.info(f"Fetch plan: {len(plan)} unique gauges for {gauge_rows} rows across "
+                f"{len(loaded)} rivers, {gauge_rows - len(plan)} requests avoided")
+    return loaded, plan
+
+
+def generate_all_reports(path, rivers=None, deadline=None):
+    """
+    Generate reports for several rivers, fetching all of their gauges concurrently.
+
+    plan_fetches reads every river's source CSV first and deduplicates gauges across
+    rivers, then each unique gauge is fetched once, through fetch_levels or (with
+    FETCH_ENGINE=pool) fetch_levels_pooled, and its value is fanned out to every
+    row that references it. Each river's ReportWriter streams rows to disk in
+    source order as values arrive, with fetches held to REPORT_WINDOW gauges ahead
+    of the oldest unfinished one, and a gauge's value is dropped once every row
+    that uses it has been written. The run takes about as long as the slowest fetch
+    rather than the sum of each river's fetches. Every river's report is written
+    even if the deadline cuts the fetches short; missing gauges are marked as
+    timed out.
+
+    Args:
+        path (str): Directory path to the input CSV files (e.g., 'program/app/src/').
+        rivers (list): River codes to process (e.g., ['ilr', 'umr', 'mor']).
+        deadline (Deadline): Run-wide time budget (default RUN_DEADLINE seconds from now).
+
+    Returns:
+        None: One CSV is written per river by make_csv.
+    """
+    deadline = deadline or Deadline(RUN_DEADLINE)
+    with run_metrics.stage('load'):
+        loaded, plan = plan_fetches(path, rivers)
+        if REPLAY_MODE != 'replay':
+            observation_store.preload(plan)
+    gauges = list(plan)
+    urls = list(plan.values())
+
+    writers = []
+    for river, (_, table) in loaded.items():
+        logger.info(f"Starting CSV writing process for {river.upper()}")
+        try:
+            writers.append(ReportWriter(river, table))
+        except OSError as e:
+            logger.error(f"Failed to write CSV for {river.upper()}: {e}")
+    levels = {}  # Gauge values waiting to be written; rows are written once every earlier row's value is here
+    unwritten = Counter(gauge for writer in writers for gauge in writer.table.gauges if gauge)
+
+    def feed_writers():
+        for writer in writers:
+            start = writer.cursor
+            writer.feed(levels)
+            for gauge in writer.table.gauges[start:writer.cursor]:
+                if gauge:
+                    unwritten[gauge] -= 1
+                    if not unwritten[gauge]:  # Every row using this gauge is on disk
+                        del unwritten[gauge]
+                        del levels[gauge]
+
+    def on_result(index, level):
+        if gauges[index] in unwritten:  # Skip gauges only a river without a writer needed
+            levels[gauges[index]] = level
+            feed_writers()
+
+    try:
+        feed_writers()  # Leading rows without a URL
+        with run_metrics.stage('fetch'):
+            if FETCH_ENGINE == 'pool':
+                fetch_levels_pooled(urls, deadline=deadline, on_result=on_result, window=REPORT_WINDOW)
+            else:
+                fetch_levels(urls, deadline=deadline, on_result=on_result, window=REPORT_WINDOW)
+        feed_writers()
+        for writer in writers:
+            writer.commit()
+    finally:
+        for writer in writers:
+            writer.abort()
+
+
+def make_csv(report, river_name, reader=None):
+    """
+    Write a finished report to a timestamped CSV file and publish it as the river's latest report.
+
+    Writes the report through a ReportWriter, which publishes it to 'reports/csv/'
+    with an atomic rename and moves the report it replaces to 'reports/csv/archive/'.
+
+    Args:
+        report (ReportTable or list): Filled report table, or a list of row
+            dictionaries with their 'Current' values filled in.
+        river_name (str): Name of the river (e.g., 'ilr', 'umr', 'mor').
+        reader (RiverCatalog): Catalog entry (or csv.DictReader) providing fieldnames
+            when `report` is a list of dictionaries.
+
+    Returns:
+        None: The function writes the CSV file, archives the previous one, and logs results.
+    """
+    logger.info(f"Starting CSV writing process for {river_name.upper()}")
+    try:
+        table = report if isinstance(report, ReportTable) else ReportTable.from_rows(
+            river_name, reader.fieldnames, report)
+        table.classify()
+        writer = ReportWriter(river_name, table)
+        try:
+            writer.write()
+            writer.commit()
+        finally:
+            writer.abort()
+    except Exception as e:
+        logger.error(f"Failed to write CSV for {river_name.upper()}: {e}")
+
+
+class ReportArchive:
+    """
+    Date-sharded, gzip-compressed store of replaced reports with an append-only index.
+
+    archive() moves a replaced report into reports/csv/archive/<river>/YYYY/MM/DD/
+    with one rename and queues it for a background worker, which gzips it, removes
+    the uncompressed copy and appends (river, timestamp, path, rows, sha256) to
+    reports/csv/archive/index.csv. The checksum is of the uncompressed CSV.
+    find() and at() answer time lookups from the index with a binary search
+    instead of walking the archive. The worker starts on the first archive() call
+    and is drained at interpreter exit, so library callers of publish_report need
+    not call shutdown(). On start it also re-queues uncompressed reports left in
+    the shards by a process that exited first, and, if there is no index yet,
+    shards and indexes reports left flat in the archive directory by earlier versions.
+    """
+
+    def __init__(self, directory, index_path):
+        self.directory = directory
+        self.index_path = index_path
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.index = {}  # River -> (sorted timestamps, entries in the same order)
+        self.index_size = -1  # Index file size when self.index was built
+
+    def archive(self, river_name, src_path):
+        """
+        Move a replaced report into its date shard and queue it for compression.
+
+        Args:
+            river_name (str): Name of the river (e.g., 'ilr', 'umr', 'mor').
+            src_path (str): Report to archive.
+
+        Returns:
+            str: Path the report was moved to (the worker later replaces it with a .gz).
+        """
+        with self.lock:
+            if self.thread is None:
+                self._start()
+        return self._shard(river_name, src_path)
+
+    @staticmethod
+    def _report_time(river_name, path):
+        try:
+            return datetime.strptime(os.path.basename(path)[len(river_name) + 1:-len('.csv')], '%Y-%m-%d_%Hh%Mm%Ss')
+        except ValueError:
+            return datetime.fromtimestamp(os.path.getmtime(path))
+
+    def _shard(self, river_name, src_path):
+        file = os.path.basename(src_path)
+        when = self._report_time(river_name, src_path)
+        shard = f'{self.directory}/{river_name}/{when:%Y/%m/%d}'
+        os.makedirs(shard, exist_ok=True)
+        dest_path = f'{shard}/{file}'
+        os.replace(src_path, dest_path)
+        self.queue.put((river_name, when, dest_path))
+        return dest_path
+
+    def _start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        for river_name in sorted(os.listdir(self.directory)):
+            for root, _, files in os.walk(f'{self.directory}/{river_name}'):
+                for file in sorted(files):
+                    if file.startswith(f'{river_name}_') and file.endswith('.csv'):
+                        self._requeue(river_name, f'{root}/{file}'.replace(os.sep, '/'))
+        if not os.path.exists(self.index_path):
+            for file in sorted(os.listdir(self.directory)):
+                path = f'{self.directory}/{file}'
+                if file.endswith('.csv') and '_' in file and os.path.isfile(path):
+                    self._shard(file.rsplit('_', 2)[0], path)
+        self.thread = threading.Thread(target=self._run, name='report-archive', daemon=True)
+        self.thread.start()
+        atexit.register(self.shutdown)
+
+    def _requeue(self, river_name, path):
+        logger.info(f"Resuming compression of archived {river_name.upper()} report {path}")
+        self.queue.put((river_name, self._report_time(river_name, path), path))
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                self._compress(*item)
+            except Exception as e:
+                logger.error(f"Failed to compress archived report {item[2]}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def _compress(self, river_name, when, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        _write_atomic(f'{path}.gz', gzip.compress(data))
+        os.remove(path)
+        rows = sum(1 for _ in csv.reader(data.decode('utf-8', 'replace').splitlines(keepends=True))) - 1
+        entry = {
+            'river': river_name,
+            'timestamp': when.isoformat(timespec='seconds'),
+            'path': os.path.relpath(f'{path}.gz', self.directory).replace(os.sep, '/'),
+            'rows': max(rows, 0),
+            'sha256': hashlib.sha256(data).hexdigest(),
+        }
+        with self.lock:
+            new_index = not os.path.exists(self.index_path)
+            with open(self.index_path, 'a', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=ARCHIVE_INDEX_FIELDS)
+                if new_index:
+                    writer.writeheader()
+                writer.writerow(entry)
+        logger.debug(f"Compressed archived {river_name.upper()} report to {path}.gz")
+
+    def flush(self):
+        """Wait until every queued report has been compressed and indexed."""
+        if self.thread is not None:
+            self.queue.join()
+
+    def shutdown(self):
+        """Finish the queued reports and stop the worker."""
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None:
+            self.queue.put(None)
+            thread.join()
+
+    def _load_index(self):
+        try:
+            size = os.path.getsize(self.index_path)
+        except FileNotFoundError:
+            return {}
+        with self.lock:
+            if size != self.index_size:
+                entries = {}
+                with open(self.index_path, newline='') as f:
+                    for entry in csv.DictReader(f):
+                        entry['rows'] = int(entry['rows'])
+                        entry['path'] = f"{self.directory}/{entry['path']}"
+                        entries.setdefault(entry['river'], []).append(entry)
+                self.index = {}
+                for river, river_entries in entries.items():
+                    river_entries.sort(key=lambda entry: entry['timestamp'])
+                    self.index[river] = ([entry['timestamp'] for entry in river_entries], river_entries)
+                self.index_size = size
+            return self.index
+
+    def find(self, river_name, start=None, end=None):
+        """
+        List a river's archived reports whose timestamps fall in [start, end].
+
+        Args:
+            river_name (str): Name of the river (e.g., 'ilr', 'umr', 'mor').
+            start (datetime): Earliest report time (default no lower bound).
+            end (datetime): Latest report time (default no upper bound).
+
+        Returns:
+            list: Index entries (dicts with river, timestamp, path, rows, sha256), oldest first.
+        """
+        timestamps, entries = self._load_index().get(river_name, ([], []))
+        low = bisect.bisect_left(timestamps, start.isoformat(timespec='seconds')) if start else 0
+        high = bisect.bisect_right(timestamps, end.isoformat(timespec='seconds')) if end else len(timestamps)
+        return entries[low:high]
+
+    def at(self, river_name, when):
+        """
+        Find the archived report that was current at a given time.
+
+        Args:
+            river_name (str): Name of the river (e.g., 'ilr', 'umr', 'mor').
+            when (datetime): Time of interest.
+
+        Returns:
+            dict: Index entry of the newest report at or before `when`, or None.
+        """
+        timestamps, entries = self._load_index().get(river_name, ([], []))
+        position = bisect.bisect_right(timestamps, when.isoformat(timespec='seconds'))
+        return entries[position - 1] if position else None
+
+
+report_archive = ReportArchive(REPORT_ARCHIVE_DIR, ARCHIVE_INDEX)
+
+
+def load_manifest():
+    """
+    Read the latest-report manifest.
+
+    Returns:
+        dict: River name -> {'file', 'rows', 'published'} for each river's current
+            report; empty if no report has been published yet.
+    """
+    try:
+        with open(REPORT_MANIFEST) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable report manifest {REPORT_MANIFEST}: {e}")
+        return {}
+
+
+def publish_report(river_name, temp_path, path, rows):
+    """
+    Make a finished report the river's latest and archive the one it replaces.
+
+    The temp file is renamed to its final name in reports/csv/, the river's entry
+    in reports/csv/latest.json is pointed at it (the manifest itself is replaced
+    atomically), and the previous report named by the old entry is moved into
+    the report archive with one rename. Readers that follow the manifest only
+    ever see complete reports. A river with no manifest entry yet falls back to
+    a one-off scan that archives any reports left by earlier versions.
+
+    Args:
+        river_name (str): Name of the river (e.g., 'ilr', 'umr', 'mor').
+        temp_path (str): Finished report in its temporary location.
+        path (str): Final report path in reports/csv/.
+        rows (int): Number of rows in the report.
+
+    Returns:
+        None
+    """
+    name = os.path.basename(path)
+    with report_lock:  # One manifest update at a time
+        manifest = load_manifest()
+        previous = manifest.get(river_name, {}).get('file')
+        os.replace(temp_path, path)
+        manifest[river_name] = {'file': name, 'rows': rows,
+                                'published': datetime.now().isoformat(timespec='seconds')}
+        _write_atomic(REPORT_MANIFEST, json.dumps(manifest, indent=2, sort_keys=True).encode())
+
+        archive_started = time.perf_counter()
+        if previous is None:
+            stale = [f for f in os.listdir(REPORT_DIR)
+                     if f.startswith(f'{river_name}_') and f.endswith('.csv') and f != name]
+        else:
+            stale = [previous] if previous != name else []
+        for file in stale:
+            try:
+                if not REPORT_ARCHIVE:
+                    os.remove(f'{REPORT_DIR}/{file}')
+                    logger.info(f"Removed replaced {river_name.upper()} CSV: {file}")
+                    continue
+                dest_path = report_archive.archive(river_name, f'{REPORT_DIR}/{file}')
+                logger.info(f"Archived {river_name.upper()} CSV: {file} to {dest_path}")
+            except FileNotFoundError:
+                logger.warning(f"Previous {river_name.upper()} CSV {file} is missing, nothing to archive")
+            except OSError as e:
+                logger.error(f"Failed to archive {file}: {e}")
+    run_metrics.add_stage('archive', time.perf_counter() - archive_started)
+
+
+def export_report(path, river_name, output, at=None):
+    """
+    Rebuild a river's report from the gauge catalog and the observation store.
+
+    Each gauge's 'Current' value is its newest stored reading at or before `at`,
+    classified against the river's thresholds, so the report for any past time
+    can be derived without keeping a copy of it.
+
+    Args:
+        path (str): Directory path to the input CSV files (e.g., 'program/app/src/').
+        river_name (str): Name of the river (e.g., 'ilr', 'umr', 'mor').
+        output (str): CSV file to write.
+        at (datetime): Report time (default now).
+
+    Returns:
+        str: Path of the written CSV, or None if the river could not be loaded.
+    """
+    loaded = load_river(path, river_name)
+    if loaded is None:
+        return None
+    _, table = loaded
+    readings = observation_store.latest((gauge for gauge in table.gauges if gauge is not None), at)
+    for index, gauge in enumerate(table.gauges):
+        if gauge in readings:
+            table.current[index] = readings[gauge][1]
+        else:
+            table.notes[index] = "No Data"
+    table.classify()
+    temp_path = f'{output}.tmp'
+    with open(temp_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(table.fieldnames)
+        writer.writerows(table.records())
+    os.replace(temp_path, output)
+    logger.info(f"{river_name.upper()} report for {(at or datetime.now()):%Y-%m-%d %H:%M} exported to {output}")
+    return output
+
+
+def run_threaded(src_location, rivers, deadline):
+    """
+    Process each river on its own thread, fetching its gauges one at a time.
+
+    This is the original execution path, kept for comparison with the async engine.
+    Threads share the run deadline; when it expires they are cancelled and given a
+    short grace period to write their partial reports.
+
+    Args:
+        src_location (str): Directory path to the input CSV files.
+        rivers (list): River codes to process.
+        deadline (Deadline): Run-wide time budget.
+
+    Returns:
+        None
+    """
+    # Create and start threads for each river
+    threads = []  # Initialize empty list for thread objects
+    thread_rivers = []  # Track river names for debugging
+    for river in rivers:
+        logger.info(f"-------Obtaining {river.upper()} river data-------")
+        try:
+            thread = threading.Thread(target=generate_reports, args=(src_location, river, deadline),
+                                      name=f'river-{river}')
+            threads.append(thread)
+            thread_rivers.append(river)  # Associate thread with river
+            thread.start()  # Start thread execution
+        except Exception as e:
+            logger.error(f"Failed to create/start thread for {river.upper()}: {e}")
+
+    # Wait for all threads to complete within the run deadline
+    for thread in threads:
+        thread.join(timeout=deadline.remaining())
+    if any(thread.is_alive() for thread in threads):
+        deadline.cancel()  # Abandon in-flight fetches so partial reports get written
+        for thread, river in zip(threads, thread_rivers):
+            thread.join(timeout=CANCEL_GRACE)
+            if thread.is_alive():
+                logger.error(f"Thread for river {river.upper()} timed out")
+
+
+def run_cycle(src_location, rivers, timeout):
+    """
+    Generate one round of reports for every river with the configured fetch engine.
+
+    Args:
+        src_location (str): Directory path to the input CSV files.
+        rivers (list): River codes to process, or None for every river found by
+            discover_rivers (rechecked each cycle).
+        timeout (float): Run deadline in seconds shared by every fetch in the cycle.
+
+    Returns:
+        None
+    """
+    deadline = Deadline(timeout)
+    rivers = rivers or discover_rivers(src_location)
+    rate_limiter.reset_stats()
+    hedger.reset_stats()
+    run_metrics.reset()
+    if FETCH_ENGINE == 'threaded':
+        run_threaded(src_location, rivers, deadline)
+    else:
+        generate_all_reports(src_location, rivers, deadline)
+
+    limits = rate_limiter.stats()
+    rates = ', '.join(f"{host} {rate:.1f} req/s" for host, rate in limits['rates'].items())
+    logger.info(f"Rate limiter: requests waited {limits['wait_time']:.2f}s in total, {limits['throttled']} throttled responses"
+                + (f", {rates}" if rates else ""))
+
+    if hedger.enabled:
+        hedges = hedger.stats()
+        delay = f"{hedges['delay'] * 1000:.0f}ms" if hedges['delay'] is not None else "not yet known"
+        logger.info(f"Hedging: {hedges['hedged']} of {hedges['fetches']} fetches hedged, "
+                    f"{hedges['won']} won by the duplicate, p{HEDGE_PERCENTILE:g} delay {delay}")
+
+    if REPLAY_MODE == 'record':
+        response_archive.save()
+
+    observation_store.flush()
+    if REPLAY_MODE != 'replay':
+        circuit_breaker.save()
+        open_gauges = circuit_breaker.open_gauges()
+        if open_gauges:
+            logger.warning(f"Circuit breaker: {len(open_gauges)} gauges open ({', '.join(open_gauges)})")
+
+    # Report connection reuse so handshake savings are visible in the log
+    stats = pool_stats()
+    logger.info(f"HTTP pool: {stats['requests']} requests, {stats['handshakes']} handshakes, "
+                f"{stats['reused']} reused connections")
+
+    if RUN_METRICS:
+        sections = {'rate_limiter': limits, 'http_pool': stats}
+        if hedger.enabled:
+            sections['hedging'] = hedges
+        run_metrics.export(**sections)
+
+
+# Daemon mode: keep the process alive and re-run the reports every REPORT_INTERVAL seconds
+REPORT_DAEMON = os.getenv("REPORT_DAEMON", "0") == "1"
+REPORT_INTERVAL = float(os.getenv("REPORT_INTERVAL", 900))
+REPORT_RIVERS = [river.strip().lower() for river in os.getenv("REPORT_RIVERS", "").split(",") if river.strip()]
+shutdown_event = threading.Event()  # Set by SIGINT/SIGTERM to stop the daemon loop
+
+
+def _request_shutdown(signum, frame):
+    logger.info(f"Received signal {signum}, shutting down after the current cycle")
+    shutdown_event.set()
+
+
+def run_daemon(src_location, rivers, timeout, interval):
+    """
+    Re-run the river reports every `interval` seconds until shutdown_event is set.
+
+    Cycles run one after another on this thread, so they never overlap; if a cycle
+    runs past its slot, the missed slots are skipped rather than queued. Sessions,
+    parsed catalogs and caches stay warm between cycles.
+
+    Args:
+        src_location (str): Directory path to the input CSV files.
+        rivers (list): River codes to process.
+        timeout (float): Run deadline in seconds for each cycle.
+        interval (float): Seconds between the starts of consecutive cycles.
+
+    Returns:
+        None
+    """
+    for signum in (getattr(signal, 'SIGINT', None), getattr(signal, 'SIGTERM', None)):
+        if signum is not None:
+            signal.signal(signum, _request_shutdown)
+
+    logger.info(f"Daemon mode: running reports every {interval:g}s")
+    next_run = time.monotonic()
+    cycle = 0
+    while not shutdown_event.is_set():
+        cycle += 1
+        started = time.monotonic()
+        logger.info(f"-------Starting report cycle {cycle}-------")
+        try:
+            run_cycle(src_location, rivers, timeout)
+        except Exception as e:
+            logger.error(f"Report cycle {cycle} failed: {e}")
+        elapsed = time.monotonic() - started
+        logger.info(f"Report cycle {cycle} finished in {elapsed:.1f}s")
+
+        next_run += interval
+        now = time.monotonic()
+        if now > next_run:
+            skipped = int((now - next_run) // interval) + 1
+            logger.warning(f"Report cycle {cycle} overran the {interval:g}s interval, skipping {skipped} slot(s)")
+            next_run += skipped * interval
+        shutdown_event.wait(next_run - now)
+
+
+def main():
+    """
+    Main function to process water level data for multiple rivers concurrently.
+
+    Uses the asyncio fetch engine by default, issuing every river's gauge requests
+    at once. Set FETCH_ENGINE=pool to run per-gauge tasks on a shared worker pool,
+    or FETCH_ENGINE=threaded to run one thread per river. Every river with a
+    source file is reported unless REPORT_RIVERS lists a subset. With REPORT_DAEMON=1 the reports are regenerated every
+    REPORT_INTERVAL seconds until the process is interrupted. With REPORT_PROFILE=1
+    the run is profiled and the results are written next to the log file in logs/.
+    Sets up logging with init_logging, logs the process and ensures proper cleanup.
+
+    Returns:
+        None
+    """
+    print('Now running the NOAA River Report Application')
+    init_logging()
+    
+    # Define source directory and list of rivers to process
+    src_location = 'program/app/src/'  # Path to input CSV files
+    rivers = REPORT_RIVERS or None    # River codes for processing; None discovers them from src_location
+
+    # Configurable run deadline
+    timeout = RUN_DEADLINE
+
+    if REPORT_PROFILE:
+        pipeline_profiler.start()
+    try:
+        if REPORT_DAEMON:
+            run_daemon(src_location, rivers, timeout, REPORT_INTERVAL)
+        else:
+            run_cycle(src_location, rivers, timeout)
+    finally:
+        if REPORT_PROFILE:
+            pipeline_profiler.stop(os.path.splitext(log_file)[0])
+        report_archive.shutdown()
+        observation_store.close()
+        shutdown_worker_pool()
+        close_sessions()
+        shutdown_logging()
+        logging.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Tests for threshold parsing and stage classification against the shipped river catalogs.
+
+Run with `python -m pytest app/tests` or `python -m unittest discover app/tests`.
+"""
+import math
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(APP_DIR, 'src') + os.sep
+CACHE_DIR = tempfile.mkdtemp(prefix='test-thresholds-')
+sys.path.insert(0, APP_DIR)
+os.environ['CATALOG_CACHE'] = os.path.join(CACHE_DIR, 'catalog.pickle')  # Never touch the real cache
+import numpy  # noqa: E402
+import report_generator  # noqa: E402
+
+
+def tearDownModule():
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+
+class ParseThresholdTest(unittest.TestCase):
+    """Every cell format used in app/src/*_src.csv."""
+
+    def test_interval(self):
+        self.assertEqual(report_generator.parse_threshold('[14.2, 15.2]'), (14.2, 15.2, 'ft'))
+
+    def test_range(self):
+        self.assertEqual(report_generator.parse_threshold('26 - 29.99'), (26.0, 29.99, 'ft'))
+
+    def test_bare_number(self):
+        self.assertEqual(report_generator.parse_threshold('22.0'), (22.0, 22.0, 'ft'))
+        self.assertEqual(report_generator.parse_threshold('14'), (14.0, 14.0, 'ft'))
+
+    def test_flow(self):
+        self.assertEqual(report_generator.parse_threshold('116KCFS'), (116.0, 116.0, 'kcfs'))
+        self.assertEqual(report_generator.parse_threshold('125 KCFS'), (125.0, 125.0, 'kcfs'))
+
+    def test_empty(self):
+        self.assertIsNone(report_generator.parse_threshold(''))
+        self.assertIsNone(report_generator.parse_threshold(None))
+
+    def test_unrecognized(self):
+        with self.assertRaises(ValueError):
+            report_generator.parse_threshold('high')
+
+
+class ClassifyTest(unittest.TestCase):
+    """Classification of the shipped ILR, UMR and MOR catalogs."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tables = {river: report_generator.load_river(SRC_DIR, river)[1] for river in ('ilr', 'umr', 'mor')}
+
+    def classify(self, river, row, value):
+        return self.tables[river].thresholds.classify([value], row, row + 1)[0]
+
+    def test_shared_edges(self):
+        # Grafton (GRFI2): Low Action 14.2, Low Watch [14.2, 15.2], Normal [15.2, 18],
+        # High Watch [18, 22], High Action 22.0
+        cases = [(14.0, 'Low Action'), (14.2, 'Low Action'), (14.3, 'Low Watch'), (15.2, 'Low Watch'),
+                 (15.3, 'Normal'), (18.0, 'High Watch'), (21.9, 'High Watch'), (22.0, 'High Action')]
+        for value, category in cases:
+            with self.subTest(value=value):
+                self.assertEqual(self.classify('ilr', 0, value), category)
+
+    def test_range_thresholds(self):
+        # Sioux City (SSCN1): Normal 28.99, High Watch 29 - 29.99, High Action 30
+        self.assertEqual(self.classify('mor', 0, 28.5), 'Normal')
+        self.assertEqual(self.classify('mor', 0, 29.5), 'High Watch')
+        self.assertEqual(self.classify('mor', 0, 30.0), 'High Action')
+
+    def test_flow_only_row_is_unclassified(self):
+        table = self.tables['umr']
+        self.assertEqual(table.thresholds.flow[1], 125.0)
+        self.assertEqual(self.classify('umr', 1, 20.0), 'Unclassified')
+        self.assertEqual(self.classify('umr', 0, 20.0), 'High Action')
+
+    def test_no_data(self):
+        for value in (None, 'No Data', report_generator.TIMED_OUT, float('nan')):
+            with self.subTest(value=value):
+                self.assertEqual(self.classify('ilr', 0, value), 'No Data')
+        self.assertEqual(self.classify('umr', 1, None), 'No Data')
+
+    def test_history(self):
+        # Two readings of the first three ILR rows: Grafton, Hardin (Low Action 18.1) and Meredosia
+        history = numpy.array([[14.2, 18.1, 23.0],
+                               [16.0, math.nan, 1.5]])
+        categories = self.tables['ilr'].thresholds.classify(history, 0, 3)
+        self.assertEqual(categories.shape, (2, 3))
+        self.assertEqual(categories.tolist(), [['Low Action', 'Low Action', 'High Action'],
+                                               ['Normal', 'No Data', 'Low Watch']])
+
+
+if __name__ == '__main__':
+    unittest.main()